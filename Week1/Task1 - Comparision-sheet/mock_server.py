@@ -0,0 +1,135 @@
+"""
+Mock LLM server
+A local OpenAI-compatible /v1/chat/completions endpoint (streaming and
+non-streaming) with a configurable time to first token and token rate, so
+the comparison runner can be exercised without API keys or network access.
+
+Usage: python mock_server.py [--port 8765] [--ttft 0.2] [--tokens-per-s 50]
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockLLMServer:
+    """Serves canned completions on ``http://host:port/v1``.
+
+    The reply is a fixed sentence naming the model followed by the first
+    ``max_tokens`` words of the prompt; each word counts as one token.
+    Use as a context manager or call ``start``/``stop``.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, ttft_s: float = 0.2,
+                 tokens_per_s: float = 50.0):
+        self.ttft_s = ttft_s
+        self.tokens_per_s = tokens_per_s
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                server.requests += 1
+                words = server.reply(body)
+                if body.get("stream"):
+                    self._stream(body, words)
+                else:
+                    self._complete(body, words)
+
+            def _complete(self, body, words):
+                time.sleep(server.ttft_s + len(words) / server.tokens_per_s)
+                payload = json.dumps({
+                    'id': "mock", 'object': "chat.completion", 'created': int(time.time()),
+                    'model': body.get("model", "mock"),
+                    'choices': [{'index': 0, 'message': {'role': "assistant", 'content': "".join(words)},
+                                 'finish_reason': "stop"}],
+                    'usage': server.usage(body, words)
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, body, words):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+
+                def send(chunk):
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                base = {'id': "mock", 'object': "chat.completion.chunk", 'created': int(time.time()),
+                        'model': body.get("model", "mock")}
+                time.sleep(server.ttft_s)
+                for word in words:
+                    send({**base, 'choices': [{'index': 0, 'delta': {'content': word}, 'finish_reason': None}]})
+                    time.sleep(1.0 / server.tokens_per_s)
+                send({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': "stop"}]})
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    send({**base, 'choices': [], 'usage': server.usage(body, words)})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @staticmethod
+    def reply(body):
+        prompt = " ".join(str(m.get("content", "")) for m in body.get("messages", []))
+        words = [f"Mock response from {body.get('model', 'mock')}."] + prompt.split()
+        return [word + " " for word in words[:int(body.get("max_tokens") or 256)]]
+
+    @staticmethod
+    def usage(body, words):
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+        return {'prompt_tokens': prompt_tokens, 'completion_tokens': len(words),
+                'total_tokens': prompt_tokens + len(words)}
+
+    def start(self) -> "MockLLMServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tokens-per-s", type=float, default=50.0)
+    args = parser.parse_args()
+
+    mock = MockLLMServer(args.host, args.port, ttft_s=args.ttft, tokens_per_s=args.tokens_per_s)
+    print(f"Mock LLM server on {mock.base_url}")
+    try:
+        mock.httpd.serve_forever()
+    except KeyboardInterrupt:
+        mock.httpd.server_close()
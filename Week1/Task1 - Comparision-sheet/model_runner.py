@@ -0,0 +1,326 @@
+"""
+Concurrent model comparison runner
+Sends one prompt to every configured model at once and streams the answers,
+recording latency, time to first token (TTFT) and tokens/sec per model. A
+run takes as long as the slowest model instead of the sum of all of them.
+
+Providers: OpenAI, Anthropic, Gemini, DeepSeek (OpenAI-compatible) and a
+local Ollama model. Each provider has its own concurrency limit, and every
+request has a timeout. With --mock all models are pointed at a local
+OpenAI-compatible mock server (mock_server.py), so no keys are needed.
+Answers are kept in an on-disk response cache (response_cache.py);
+--cache-mode replay regenerates output from it without calling any model.
+
+Used by appdev_comparison.py, data_analytics_comparison.py and devops_comparison.py:
+    python devops_comparison.py [--models "GPT-4o" "Gemma 2B"] [--timeout 120] [--follow "GPT-4o"] [--mock]
+                                [--cache-mode use|refresh|replay|off] [--cache-ttl-hours 24]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, asdict, replace
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from response_cache import ResponseCache, MODES as CACHE_MODES
+
+
+@dataclass
+class ModelSpec:
+    label: str
+    provider: str
+    model: str
+    api_key_env: Optional[str] = None
+    base_url: Optional[str] = None
+    max_tokens: int = 2000
+    temperature: float = 0.7
+    api: Optional[str] = None  # wire protocol when it differs from the provider's own (see mock_models)
+
+
+@dataclass
+class RunResult:
+    label: str
+    provider: str
+    model: str
+    text: str = ""
+    error: Optional[str] = None
+    latency_s: float = 0.0
+    ttft_s: Optional[float] = None
+    output_tokens: int = 0
+    tokens_per_s: float = 0.0
+    cached: bool = False  # timings are then those of the original run
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+DEFAULT_MODELS = [
+    ModelSpec("GPT-4o", "openai", "gpt-4o", api_key_env="OPENAI_API_KEY"),
+    ModelSpec("Claude Sonnet 4", "anthropic", "claude-sonnet-4-20250514", api_key_env="ANTHROPIC_API_KEY"),
+    ModelSpec("Gemini Flash", "gemini", "gemini-1.5-flash", api_key_env="GOOGLE_API_KEY"),
+    ModelSpec("DeepSeek Coder", "deepseek", "deepseek-coder", api_key_env="DEEPSEEK_API_KEY",
+              base_url="https://api.deepseek.com"),
+    ModelSpec("Gemma 2B", "ollama", "gemma:2b"),
+]
+
+# Requests in flight per provider; a local Ollama server generates one answer at a time.
+DEFAULT_PROVIDER_LIMITS = {'openai': 4, 'anthropic': 2, 'gemini': 4, 'deepseek': 2, 'ollama': 1}
+
+
+async def _stream_openai(spec: ModelSpec, prompt: str, usage: Dict) -> AsyncIterator[str]:
+    from openai import AsyncOpenAI
+
+    client = AsyncOpenAI(api_key=os.getenv(spec.api_key_env or "", "") or "unused", base_url=spec.base_url)
+    stream = await client.chat.completions.create(
+        model=spec.model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=spec.temperature,
+        max_tokens=spec.max_tokens,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    async for chunk in stream:
+        if chunk.usage is not None:
+            usage['output_tokens'] = chunk.usage.completion_tokens
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def _stream_anthropic(spec: ModelSpec, prompt: str, usage: Dict) -> AsyncIterator[str]:
+    from anthropic import AsyncAnthropic
+
+    client = AsyncAnthropic(api_key=os.getenv(spec.api_key_env or ""))
+    async with client.messages.stream(
+        model=spec.model,
+        max_tokens=spec.max_tokens,
+        temperature=spec.temperature,
+        messages=[{"role": "user", "content": prompt}]
+    ) as stream:
+        async for text in stream.text_stream:
+            yield text
+        message = await stream.get_final_message()
+        usage['output_tokens'] = message.usage.output_tokens
+
+
+async def _stream_gemini(spec: ModelSpec, prompt: str, usage: Dict) -> AsyncIterator[str]:
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.getenv(spec.api_key_env or ""))
+    model = genai.GenerativeModel(spec.model)
+    response = await model.generate_content_async(
+        prompt,
+        stream=True,
+        generation_config={'temperature': spec.temperature, 'max_output_tokens': spec.max_tokens}
+    )
+    async for chunk in response:
+        if getattr(chunk, "usage_metadata", None) is not None:
+            usage['output_tokens'] = chunk.usage_metadata.candidates_token_count
+        try:
+            yield chunk.text
+        except ValueError:  # chunk without text parts (e.g. safety metadata only)
+            continue
+
+
+async def _stream_ollama(spec: ModelSpec, prompt: str, usage: Dict) -> AsyncIterator[str]:
+    from ollama import AsyncClient
+
+    client = AsyncClient(host=spec.base_url)
+    async for part in await client.generate(
+        model=spec.model,
+        prompt=prompt,
+        stream=True,
+        options={'temperature': spec.temperature, 'num_predict': spec.max_tokens}
+    ):
+        if part.done:
+            usage['output_tokens'] = part.eval_count
+        yield part.response
+
+
+STREAMERS = {
+    'openai': _stream_openai,
+    'deepseek': _stream_openai,
+    'anthropic': _stream_anthropic,
+    'gemini': _stream_gemini,
+    'ollama': _stream_ollama,
+}
+
+
+CACHED_FIELDS = ('text', 'latency_s', 'ttft_s', 'output_tokens', 'tokens_per_s')
+
+
+def cache_key(spec: ModelSpec, prompt: str) -> str:
+    return ResponseCache.key(spec.provider, spec.model, prompt,
+                             {'temperature': spec.temperature, 'max_tokens': spec.max_tokens, 'api': spec.api})
+
+
+async def run_model(spec: ModelSpec, prompt: str, limit: asyncio.Semaphore, timeout_s: float,
+                    on_token: Optional[Callable[[ModelSpec, str], None]] = None,
+                    cache: Optional[ResponseCache] = None) -> RunResult:
+    """Stream one model's answer. Errors and timeouts are recorded in the result, not raised.
+
+    With a ``cache``, a stored answer for the same provider, model, prompt
+    and sampling params is returned without a request (``cached=True``), and
+    successful answers are stored. In replay mode a miss is an error.
+
+    Latency and TTFT are measured from when the request is sent, i.e. after
+    waiting for a provider slot. tokens/sec covers the decode phase (after
+    the first token) and uses the provider's token count when it reports one,
+    otherwise the number of streamed chunks.
+    """
+    result = RunResult(spec.label, spec.provider, spec.model)
+    key = None
+    if cache is not None and cache.mode != "off":
+        key = cache_key(spec, prompt)
+        entry = cache.get(key)
+        if entry is not None:
+            if on_token is not None:
+                on_token(spec, entry['text'])
+            return replace(result, cached=True, **{field: entry[field] for field in CACHED_FIELDS})
+        if cache.mode == "replay":
+            result.error = "Not in response cache (replay mode)"
+            return result
+
+    if spec.api_key_env and not os.getenv(spec.api_key_env):
+        result.error = f"No API key provided ({spec.api_key_env})"
+        return result
+
+    async with limit:
+        usage = {}
+        pieces = []
+        start = time.perf_counter()
+
+        async def consume():
+            async for text in STREAMERS[spec.api or spec.provider](spec, prompt, usage):
+                if not text:
+                    continue
+                if result.ttft_s is None:
+                    result.ttft_s = time.perf_counter() - start
+                pieces.append(text)
+                if on_token is not None:
+                    on_token(spec, text)
+
+        try:
+            await asyncio.wait_for(consume(), timeout_s)
+        except asyncio.TimeoutError:
+            result.error = f"Timed out after {timeout_s:g}s"
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        result.latency_s = time.perf_counter() - start
+
+    result.text = "".join(pieces)
+    result.output_tokens = usage.get('output_tokens') or len(pieces)
+    if result.ttft_s is not None and result.latency_s > result.ttft_s:
+        result.tokens_per_s = result.output_tokens / (result.latency_s - result.ttft_s)
+    if key is not None and result.ok:
+        cache.put(key, {field: getattr(result, field) for field in CACHED_FIELDS})
+    return result
+
+
+async def run_all(prompt: str, models: List[ModelSpec], timeout_s: float = 120.0,
+                  provider_limits: Optional[Dict[str, int]] = None,
+                  on_token: Optional[Callable[[ModelSpec, str], None]] = None,
+                  on_result: Optional[Callable[[RunResult], None]] = None,
+                  cache: Optional[ResponseCache] = None) -> List[RunResult]:
+    """Run ``prompt`` on every model concurrently; results come back in ``models`` order.
+
+    ``on_result`` is called as each model finishes, in completion order.
+    """
+    limits = {**DEFAULT_PROVIDER_LIMITS, **(provider_limits or {})}
+    semaphores = {provider: asyncio.Semaphore(limits.get(provider, 1)) for provider in {m.provider for m in models}}
+
+    async def run(spec):
+        result = await run_model(spec, prompt, semaphores[spec.provider], timeout_s, on_token, cache)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    return await asyncio.gather(*(run(spec) for spec in models))
+
+
+def mock_models(models: List[ModelSpec], base_url: str) -> List[ModelSpec]:
+    """Point every model at an OpenAI-compatible server, keeping labels,
+    sampling params and per-provider concurrency limits."""
+    return [replace(spec, api="openai", api_key_env=None, base_url=base_url) for spec in models]
+
+
+def format_summary(results: List[RunResult], wall_s: float) -> str:
+    lines = [f"{'model':<18} {'status':<8} {'ttft s':>8} {'latency s':>10} {'tokens':>7} {'tok/s':>8}"]
+    for r in results:
+        if r.ok:
+            status = "cached" if r.cached else "ok"
+            lines.append(f"{r.label:<18} {status:<8} {r.ttft_s or 0.0:>8.2f} {r.latency_s:>10.2f} "
+                         f"{r.output_tokens:>7} {r.tokens_per_s:>8.1f}")
+        else:
+            lines.append(f"{r.label:<18} {'error':<8} {r.error}")
+    serial_s = sum(r.latency_s for r in results if not r.cached)
+    lines.append(f"Wall time {wall_s:.2f}s (sum of model latencies {serial_s:.2f}s)")
+    return "\n".join(lines)
+
+
+def main(prompt: str, title: str, argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=title)
+    parser.add_argument("--models", nargs="+", help="labels to run (default: all)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument("--follow", help="stream this model's tokens to stdout as they arrive")
+    parser.add_argument("--mock", action="store_true", help="use a local mock server instead of the providers")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--cache-dir", default="./response_cache")
+    parser.add_argument("--cache-mode", choices=CACHE_MODES, default="use")
+    parser.add_argument("--cache-max-entries", type=int, default=10_000)
+    parser.add_argument("--cache-max-mb", type=float, default=256.0)
+    parser.add_argument("--cache-ttl-hours", type=float, help="expire cached answers after this long (default: never)")
+    args = parser.parse_args(argv)
+
+    cache = None
+    if args.cache_mode != "off":
+        cache = ResponseCache(args.cache_dir, mode=args.cache_mode, max_entries=args.cache_max_entries,
+                              max_bytes=int(args.cache_max_mb * 1024 * 1024),
+                              ttl_s=args.cache_ttl_hours * 3600 if args.cache_ttl_hours else None)
+
+    models = [m for m in DEFAULT_MODELS if not args.models or m.label in args.models]
+
+    print("\n" + "=" * 80)
+    print(title)
+    print("=" * 80 + "\n")
+
+    def on_token(spec, text):
+        if spec.label == args.follow:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+    def on_result(result):
+        if result.label == args.follow and result.ok:
+            print("\n")
+            return
+        print("=" * 80)
+        print(f"{result.label} ({result.model})")
+        print("=" * 80)
+        print(result.text if result.ok else f"{result.label} Error: {result.error}")
+        print("\n")
+
+    async def run():
+        start = time.perf_counter()
+        results = await run_all(prompt, models, timeout_s=args.timeout, on_token=on_token, on_result=on_result,
+                                cache=cache)
+        return results, time.perf_counter() - start
+
+    if args.mock:
+        from mock_server import MockLLMServer
+
+        with MockLLMServer() as mock:
+            models = mock_models(models, mock.base_url)
+            results, wall_s = asyncio.run(run())
+    else:
+        results, wall_s = asyncio.run(run())
+
+    print(format_summary(results, wall_s))
+    if cache is not None:
+        print(f"Response cache: {cache.stats()}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'title': title, 'wall_s': wall_s, 'results': [asdict(r) for r in results]}, f, indent=2)
+    return results
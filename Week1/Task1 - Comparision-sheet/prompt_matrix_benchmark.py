@@ -0,0 +1,181 @@
+"""
+Prompt matrix benchmark
+Runs every prompt x model x sampling setting cell for a number of trials on a
+bounded worker pool (per-provider concurrency limits still apply) and writes
+per-cell latency, TTFT and tokens/sec statistics with p50/p95 figures to a
+columnar file: Parquet when pyarrow is installed, CSV otherwise. Raw trials
+go next to it with a ``_trials`` suffix.
+
+By default the prompts are the AppDev, Data Analytics and DevOps prompts of
+the comparison scripts. A JSON matrix file can replace any axis:
+    {"prompts": {"name": "text"}, "models": ["GPT-4o"], "sampling": [{"temperature": 0.2, "max_tokens": 512}]}
+
+Usage: python prompt_matrix_benchmark.py [--matrix m.json] [--trials 5] [--workers 8] [--mock] [--out results.parquet]
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import math
+import os
+import time
+from dataclasses import replace
+from typing import Dict, List
+
+from model_runner import DEFAULT_MODELS, DEFAULT_PROVIDER_LIMITS, mock_models, run_model
+import appdev_comparison
+import data_analytics_comparison
+import devops_comparison
+
+DEFAULT_PROMPTS = {
+    'appdev': appdev_comparison.PROMPT,
+    'data_analytics': data_analytics_comparison.PROMPT,
+    'devops': devops_comparison.PROMPT,
+}
+DEFAULT_SAMPLING = [{'temperature': 0.7, 'max_tokens': 2000}]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Linear-interpolated percentile (``q`` in 0-100); NaN for no values."""
+    if not values:
+        return math.nan
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+async def run_matrix(prompts: Dict[str, str], models, sampling: List[Dict], trials: int, workers: int,
+                     timeout_s: float) -> List[Dict]:
+    """Run every (prompt, model, sampling, trial) job on ``workers`` concurrent workers; returns one row per job."""
+    jobs: asyncio.Queue = asyncio.Queue()
+    for trial in range(trials):
+        for prompt_name in prompts:
+            for spec in models:
+                for setting_index, setting in enumerate(sampling):
+                    jobs.put_nowait((prompt_name, replace(spec, **setting), setting_index, trial))
+    total = jobs.qsize()
+    semaphores = {provider: asyncio.Semaphore(DEFAULT_PROVIDER_LIMITS.get(provider, 1))
+                  for provider in {m.provider for m in models}}
+    rows = []
+
+    async def worker():
+        while True:
+            try:
+                prompt_name, spec, setting_index, trial = jobs.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            result = await run_model(spec, prompts[prompt_name], semaphores[spec.provider], timeout_s)
+            rows.append({
+                'prompt': prompt_name,
+                'model': spec.label,
+                'provider': spec.provider,
+                'temperature': spec.temperature,
+                'max_tokens': spec.max_tokens,
+                'setting': setting_index,
+                'trial': trial,
+                'ok': result.ok,
+                'error': result.error or "",
+                'latency_s': result.latency_s,
+                'ttft_s': result.ttft_s if result.ttft_s is not None else math.nan,
+                'output_tokens': result.output_tokens,
+                'tokens_per_s': result.tokens_per_s,
+            })
+            if len(rows) % 10 == 0 or len(rows) == total:
+                print(f"{len(rows)}/{total} runs done")
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return rows
+
+
+def summarize(rows: List[Dict]) -> List[Dict]:
+    cells: Dict[tuple, List[Dict]] = {}
+    for row in rows:
+        cells.setdefault((row['prompt'], row['model'], row['setting']), []).append(row)
+
+    summary = []
+    for (prompt_name, model, setting), cell in sorted(cells.items()):
+        ok = [row for row in cell if row['ok']]
+        stats = {
+            'prompt': prompt_name,
+            'model': model,
+            'provider': cell[0]['provider'],
+            'temperature': cell[0]['temperature'],
+            'max_tokens': cell[0]['max_tokens'],
+            'trials': len(cell),
+            'errors': len(cell) - len(ok),
+            'mean_output_tokens': sum(row['output_tokens'] for row in ok) / len(ok) if ok else math.nan,
+        }
+        for metric in ('latency_s', 'ttft_s', 'tokens_per_s'):
+            values = [row[metric] for row in ok if not math.isnan(row[metric])]
+            stats[f"{metric}_p50"] = percentile(values, 50)
+            stats[f"{metric}_p95"] = percentile(values, 95)
+        summary.append(stats)
+    return summary
+
+
+def write_columnar(rows: List[Dict], path: str) -> str:
+    """Write ``rows`` column-wise to Parquet, or to CSV when pyarrow is unavailable. Returns the path written."""
+    columns = {key: [row[key] for row in rows] for key in rows[0]} if rows else {}
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        path = os.path.splitext(path)[0] + ".csv"
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(zip(*columns.values()))
+        return path
+    pq.write_table(pa.Table.from_pydict(columns), path)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prompt x model x sampling benchmark")
+    parser.add_argument("--matrix", help="JSON file with any of: prompts, models, sampling")
+    parser.add_argument("--models", nargs="+", help="model labels (overrides the matrix file)")
+    parser.add_argument("--trials", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=4, help="requests in flight across all cells")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--mock", action="store_true", help="use a local mock server instead of the providers")
+    parser.add_argument("--out", default="prompt_matrix.parquet")
+    args = parser.parse_args()
+
+    matrix = {}
+    if args.matrix:
+        with open(args.matrix) as f:
+            matrix = json.load(f)
+    prompts = matrix.get('prompts', DEFAULT_PROMPTS)
+    labels = args.models or matrix.get('models')
+    models = [m for m in DEFAULT_MODELS if not labels or m.label in labels]
+    sampling = matrix.get('sampling', DEFAULT_SAMPLING)
+    print(f"{len(prompts)} prompts x {len(models)} models x {len(sampling)} settings x {args.trials} trials, "
+          f"{args.workers} workers")
+
+    start = time.perf_counter()
+    if args.mock:
+        from mock_server import MockLLMServer
+
+        with MockLLMServer() as mock:
+            rows = asyncio.run(run_matrix(prompts, mock_models(models, mock.base_url), sampling, args.trials,
+                                          args.workers, args.timeout))
+    else:
+        rows = asyncio.run(run_matrix(prompts, models, sampling, args.trials, args.workers, args.timeout))
+    wall_s = time.perf_counter() - start
+
+    summary = summarize(rows)
+    print(f"\n{'prompt':<16} {'model':<18} {'temp':>5} {'ok':>5} {'lat p50':>8} {'lat p95':>8} "
+          f"{'ttft p50':>9} {'tok/s p50':>10}")
+    for cell in sorted(summary, key=lambda c: (c['prompt'], c['latency_s_p50'] if c['errors'] < c['trials'] else math.inf)):
+        print(f"{cell['prompt']:<16} {cell['model']:<18} {cell['temperature']:>5.2f} "
+              f"{cell['trials'] - cell['errors']:>2}/{cell['trials']:<2} {cell['latency_s_p50']:>8.2f} "
+              f"{cell['latency_s_p95']:>8.2f} {cell['ttft_s_p50']:>9.2f} {cell['tokens_per_s_p50']:>10.1f}")
+    print(f"\n{len(rows)} runs in {wall_s:.1f}s")
+
+    summary_path = write_columnar(summary, args.out)
+    root, ext = os.path.splitext(args.out)
+    trials_path = write_columnar(rows, f"{root}_trials{ext}")
+    print(f"Results written to {summary_path} and {trials_path}")
@@ -0,0 +1,119 @@
+"""
+On-disk response cache for the comparison runner
+Content-addressed: an entry's file name is the SHA-256 of (provider, model,
+prompt hash, sampling params), so an identical request always maps to the
+same file and any change to the prompt or sampling misses.
+
+Modes:
+    use      serve hits, call the model on a miss and store the answer (default)
+    refresh  always call the model and overwrite the stored answer
+    replay   serve hits only; a miss is an error and no model is ever called
+    off      no caching
+
+Entries expire after ``ttl_s``; the least recently used entries are evicted
+once ``max_entries`` or ``max_bytes`` is exceeded.
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Optional
+
+MODES = ("use", "refresh", "replay", "off")
+
+
+class ResponseCache:
+    def __init__(self, cache_dir: str = "./response_cache", mode: str = "use",
+                 max_entries: Optional[int] = 10_000, max_bytes: Optional[int] = 256 * 1024 * 1024,
+                 ttl_s: Optional[float] = None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}; expected one of {', '.join(MODES)}")
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._sizes = {}
+        for name in os.listdir(cache_dir):
+            if name.endswith(".json"):
+                self._sizes[name[:-5]] = os.path.getsize(os.path.join(cache_dir, name))
+        self._total_bytes = sum(self._sizes.values())
+
+    @staticmethod
+    def key(provider: str, model: str, prompt: str, params: Dict) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        material = json.dumps({'provider': provider, 'model': model, 'prompt': prompt_hash, 'params': params},
+                              sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key: str) -> Optional[Dict]:
+        """The stored entry for ``key``, or None on a miss, an expired entry or in refresh/off mode."""
+        if self.mode in ("refresh", "off") or key not in self._sizes:
+            self.misses += 1
+            return None
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._forget(key)
+            self.misses += 1
+            return None
+        if self.ttl_s is not None and time.time() - entry['created_at'] > self.ttl_s:
+            self._forget(key)
+            self.misses += 1
+            return None
+        os.utime(path)  # mtime doubles as the LRU clock
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, value: Dict):
+        if self.mode in ("replay", "off"):
+            return
+        entry = {**value, 'created_at': time.time()}
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+        self._total_bytes -= self._sizes.get(key, 0)
+        self._sizes[key] = os.path.getsize(path)
+        self._total_bytes += self._sizes[key]
+        self._evict()
+
+    def _forget(self, key: str):
+        self._total_bytes -= self._sizes.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _over_limit(self) -> bool:
+        return ((self.max_entries is not None and len(self._sizes) > self.max_entries)
+                or (self.max_bytes is not None and self._total_bytes > self.max_bytes))
+
+    def _evict(self):
+        if not self._over_limit():
+            return
+        by_age = sorted(self._sizes, key=lambda k: os.path.getmtime(self._path(k)))
+        for key in by_age:
+            if not self._over_limit():
+                break
+            self._forget(key)
+
+    def clear(self):
+        for key in list(self._sizes):
+            self._forget(key)
+
+    def stats(self) -> Dict:
+        return {'mode': self.mode, 'entries': len(self._sizes), 'bytes': self._total_bytes,
+                'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from mock_server import MockLLMServer
+from model_runner import DEFAULT_MODELS, mock_models, run_all
+from response_cache import ResponseCache
+
+pytest.importorskip("openai")
+
+PROMPT = "Compare three ways to deploy a web service"
+
+
+@pytest.fixture
+def mock():
+    with MockLLMServer(ttft_s=0.01, tokens_per_s=1000) as server:
+        yield server
+
+
+def test_run_all_against_mock_server(mock):
+    models = mock_models(DEFAULT_MODELS, mock.base_url)
+    finished = []
+    results = asyncio.run(run_all(PROMPT, models, timeout_s=30, on_result=finished.append))
+
+    assert [r.label for r in results] == [m.label for m in DEFAULT_MODELS]
+    assert sorted(r.label for r in finished) == sorted(r.label for r in results)
+    assert mock.requests == len(models)
+    for spec, result in zip(models, results):
+        assert result.ok, result.error
+        assert result.provider == spec.provider  # per-provider limits still apply
+        assert result.text.startswith(f"Mock response from {spec.model}.")
+        assert result.output_tokens == 1 + len(PROMPT.split())  # the mock's lead sentence counts as one
+        assert result.ttft_s is not None and 0 < result.ttft_s <= result.latency_s
+        assert not result.cached
+
+
+def test_max_tokens_is_sent(mock):
+    models = mock_models(DEFAULT_MODELS[:1], mock.base_url)
+    models[0].max_tokens = 3
+    (result,) = asyncio.run(run_all(PROMPT, models, timeout_s=30))
+    assert result.output_tokens == 3
+
+
+def test_replay_serves_cached_answers_without_requests(mock, tmp_path):
+    models = mock_models(DEFAULT_MODELS, mock.base_url)
+    live = asyncio.run(run_all(PROMPT, models, timeout_s=30, cache=ResponseCache(str(tmp_path))))
+    requests = mock.requests
+
+    replayed = asyncio.run(run_all(PROMPT, models, timeout_s=30,
+                                   cache=ResponseCache(str(tmp_path), mode="replay")))
+    assert mock.requests == requests
+    assert all(r.cached for r in replayed)
+    assert [r.text for r in replayed] == [r.text for r in live]
+
+    (missing,) = asyncio.run(run_all("another prompt", models[:1], timeout_s=30,
+                                     cache=ResponseCache(str(tmp_path), mode="replay")))
+    assert not missing.ok and "replay" in missing.error
@@ -0,0 +1,76 @@
+import os
+import time
+
+import pytest
+
+from response_cache import ResponseCache
+
+PARAMS = {'temperature': 0.7, 'max_tokens': 2000}
+
+
+def test_key_changes_with_any_input():
+    key = ResponseCache.key("openai", "gpt-4o", "prompt", PARAMS)
+    assert key == ResponseCache.key("openai", "gpt-4o", "prompt", dict(reversed(list(PARAMS.items()))))
+    assert key != ResponseCache.key("openai", "gpt-4o", "prompt!", PARAMS)
+    assert key != ResponseCache.key("openai", "gpt-4o-mini", "prompt", PARAMS)
+    assert key != ResponseCache.key("openai", "gpt-4o", "prompt", {**PARAMS, 'temperature': 0.2})
+
+
+def test_put_get_and_reload(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    assert cache.get("k") is None
+    cache.put("k", {'text': "answer"})
+    assert cache.get("k")['text'] == "answer"
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+    reopened = ResponseCache(str(tmp_path))
+    assert reopened.get("k")['text'] == "answer"
+    assert reopened.stats()['entries'] == 1
+
+
+def test_modes(tmp_path):
+    ResponseCache(str(tmp_path)).put("k", {'text': "old"})
+
+    refresh = ResponseCache(str(tmp_path), mode="refresh")
+    assert refresh.get("k") is None
+    refresh.put("k", {'text': "new"})
+
+    replay = ResponseCache(str(tmp_path), mode="replay")
+    assert replay.get("k")['text'] == "new"
+    replay.put("other", {'text': "ignored"})
+    assert replay.get("other") is None
+
+    assert ResponseCache(str(tmp_path), mode="off").get("k") is None
+    with pytest.raises(ValueError):
+        ResponseCache(str(tmp_path), mode="sometimes")
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_entries=2)
+    cache.put("a", {'text': "a"})
+    cache.put("b", {'text': "b"})
+    past = time.time() - 60
+    os.utime(os.path.join(str(tmp_path), "b.json"), (past, past))
+    cache.put("c", {'text': "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_evicts_by_size(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_entries=None, max_bytes=300)
+    for i in range(5):
+        cache.put(str(i), {'text': "x" * 100})
+    assert cache.stats()['bytes'] <= 300
+    assert cache.get("4") is not None
+
+
+def test_ttl(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl_s=60)
+    cache.put("k", {'text': "answer"})
+    assert cache.get("k") is not None
+
+    expired = ResponseCache(str(tmp_path), ttl_s=0)
+    time.sleep(0.01)
+    assert expired.get("k") is None
+    assert expired.stats()['entries'] == 0
+    assert not os.path.exists(os.path.join(str(tmp_path), "k.json"))
@@ -0,0 +1,49 @@
+"""
+Chunker throughput benchmark
+Compares NLTKTextChunker.chunk_text (whole-document) with the streaming
+chunk_pages path, with and without a BERT token budget, on a PDF.
+
+Usage: python benchmark_chunker.py [docs.pdf] [repeats]
+"""
+
+import sys
+import time
+
+from transformers import BertTokenizerFast
+
+from rag_system import DocumentProcessor, NLTKTextChunker
+
+
+def time_it(fn, repeats: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    pdf_path = sys.argv[1] if len(sys.argv) > 1 else "docs.pdf"
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    pages = list(DocumentProcessor().iter_pdf_pages(pdf_path))
+    text = "\n".join(page_text for _, page_text in pages)
+    tokenizer = BertTokenizerFast.from_pretrained('bert-base-uncased')
+
+    plain = NLTKTextChunker(window_size=3, overlap=1)
+    budgeted = NLTKTextChunker(window_size=3, overlap=1, max_tokens=510, tokenizer=tokenizer)
+
+    cases = [
+        ("chunk_text (current)", lambda: plain.chunk_text(text)),
+        ("chunk_pages (streaming)", lambda: list(plain.chunk_pages(pages))),
+        ("chunk_pages (510-token budget)", lambda: list(budgeted.chunk_pages(pages))),
+    ]
+
+    print(f"{pdf_path}: {len(pages)} pages, {len(text)} characters, best of {repeats}")
+    print(f"{'implementation':<32} {'chunks':>8} {'seconds':>9} {'chunks/s':>10} {'>510 tok':>9}")
+    for name, fn in cases:
+        seconds, chunks = time_it(fn, repeats)
+        too_long = sum(1 for chunk in chunks if budgeted.count_tokens(chunk['text']) > 510)
+        print(f"{name:<32} {len(chunks):>8} {seconds:>9.3f} {len(chunks) / seconds:>10.0f} {too_long:>9}")
@@ -0,0 +1,62 @@
+"""
+Embedding backend benchmark
+Embeds the chunks of a PDF with each embedding backend and runtime, and
+reports ingest throughput (chunks/s) and single-query embedding latency.
+Runtimes whose optional dependencies are missing are skipped.
+
+Usage: python benchmark_embedders.py [docs.pdf] [backend ...]
+"""
+
+import statistics
+import sys
+import time
+
+from rag_system import DocumentProcessor, NLTKTextChunker, EMBEDDING_BACKENDS, make_embedder
+
+RUNTIMES = ["torch", "compile", "onnx"]
+
+QUESTIONS = [
+    "How do I create an index?",
+    "What does VACUUM do?",
+    "How are transactions isolated?",
+    "What is the default value of shared_buffers?",
+    "How do I grant privileges on a table to a role?",
+]
+
+
+if __name__ == "__main__":
+    pdf_path = sys.argv[1] if len(sys.argv) > 1 else "docs.pdf"
+    backends = sys.argv[2:] or list(EMBEDDING_BACKENDS)
+
+    # Same chunk texts for every backend so only the embedder differs.
+    chunks = list(NLTKTextChunker(window_size=3, overlap=1).chunk_pages(
+        DocumentProcessor().iter_pdf_pages(pdf_path)))
+    texts = [chunk['text'] for chunk in chunks]
+    print(f"{pdf_path}: {len(texts)} chunks")
+
+    print(f"{'backend':<10} {'runtime':<8} {'dim':>5} {'chunks/s':>10} {'query p50 ms':>13} {'query p95 ms':>13}")
+    for backend in backends:
+        for runtime in RUNTIMES:
+            try:
+                embedder = make_embedder(backend, runtime=runtime, cache_dir=None)
+                # Warm-up; torch.compile only compiles (and can fail) on the first call.
+                embedder.batch_embed(texts[:32])
+            except (ImportError, RuntimeError) as e:
+                print(f"{backend:<10} {runtime:<8} skipped: {e}")
+                continue
+
+            start = time.perf_counter()
+            embedder.batch_embed(texts)
+            chunks_per_s = len(texts) / (time.perf_counter() - start)
+
+            latencies = []
+            for _ in range(5):
+                for question in QUESTIONS:
+                    start = time.perf_counter()
+                    embedder.get_embedding(question)
+                    latencies.append((time.perf_counter() - start) * 1000)
+            latencies.sort()
+            p95 = latencies[int(0.95 * (len(latencies) - 1))]
+
+            print(f"{backend:<10} {runtime:<8} {embedder.dim:>5} {chunks_per_s:>10.1f} "
+                  f"{statistics.median(latencies):>13.2f} {p95:>13.2f}")
@@ -0,0 +1,88 @@
+"""
+Quantization benchmark: recall@k versus index memory
+Builds an in-memory FaissVectorStore for each quantization mode over the same
+vectors and compares its top-k against exact float32 search. A mode whose
+index has too few vectors to train (pq needs 256 x 39) would silently fall
+back to brute force, so it is reported as untrained instead; use
+--synthetic to measure it.
+
+Usage:
+    python benchmark_quantization.py docs.pdf [k]         # BERT embeddings of docs.pdf chunks
+    python benchmark_quantization.py --synthetic 100000   # random clustered vectors
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from rag_system import DocumentProcessor, NLTKTextChunker, BERTEmbedder, FaissVectorStore
+
+MODES = [
+    ("float32", None),
+    ("float16", "fp16"),
+    ("int8", "int8"),
+    ("pq96", "pq"),
+]
+
+
+def pdf_vectors(pdf_path: str) -> np.ndarray:
+    embedder = BERTEmbedder(cache_dir="./embedding_cache")
+    chunker = NLTKTextChunker(window_size=3, overlap=1, max_tokens=embedder.max_length - 2,
+                              tokenizer=embedder.tokenizer)
+    chunks = list(chunker.chunk_pages(DocumentProcessor().iter_pdf_pages(pdf_path)))
+    return embedder.batch_embed([chunk['text'] for chunk in chunks])
+
+
+def synthetic_vectors(n: int, dim: int = 768, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return centers[labels] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def build_store(vectors: np.ndarray, quantization, rerank_factor: int) -> FaissVectorStore:
+    store = FaissVectorStore(dim=vectors.shape[1], index_type="flat", persist_directory=None,
+                             quantization=quantization, rerank_factor=rerank_factor)
+    chunks = [{'id': str(i), 'text': '', 'start_sentence': 0, 'end_sentence': 0, 'num_sentences': 0}
+              for i in range(len(vectors))]
+    store.add_documents(chunks, vectors)
+    return store
+
+
+def recall_at_k(store: FaissVectorStore, queries: np.ndarray, truth, k: int) -> float:
+    results = store.search_batch(queries, n_results=k)
+    hits = sum(len(set(found) & expected) for found, expected in zip(results['ids'], truth))
+    return hits / (k * len(queries))
+
+
+if __name__ == "__main__":
+    k = 10
+    if len(sys.argv) > 1 and sys.argv[1] == "--synthetic":
+        vectors = synthetic_vectors(int(sys.argv[2]) if len(sys.argv) > 2 else 100_000)
+    else:
+        vectors = pdf_vectors(sys.argv[1] if len(sys.argv) > 1 else "docs.pdf")
+        k = int(sys.argv[2]) if len(sys.argv) > 2 else k
+
+    rng = np.random.default_rng(1)
+    sample = rng.choice(len(vectors), size=min(200, len(vectors)), replace=False)
+    queries = vectors[sample] + 0.1 * rng.standard_normal((len(sample), vectors.shape[1])).astype(np.float32)
+
+    exact = build_store(vectors, None, 1)
+    truth = [set(ids) for ids in exact.search_batch(queries, n_results=k)['ids']]
+    float32_bytes = exact.memory_bytes()
+
+    print(f"{len(vectors)} vectors of dim {vectors.shape[1]}, {len(queries)} queries, k={k}")
+    print(f"{'mode':<10} {'index MB':>9} {'ratio':>6} {'recall':>7} {'recall+rr':>10} {'ms/query':>9}")
+    for name, quantization in MODES:
+        raw = build_store(vectors, quantization, 1)
+        if raw.index.ntotal < len(vectors):
+            print(f"{name:<10} untrained: {len(vectors)} vectors are too few to train this index")
+            continue
+        reranked = build_store(vectors, quantization, 4) if quantization else raw
+        start = time.perf_counter()
+        recall_rr = recall_at_k(reranked, queries, truth, k)
+        ms_per_query = (time.perf_counter() - start) * 1000 / len(queries)
+        size = raw.memory_bytes()
+        print(f"{name:<10} {size / 1e6:>9.1f} {float32_bytes / size:>5.1f}x "
+              f"{recall_at_k(raw, queries, truth, k):>7.3f} {recall_rr:>10.3f} {ms_per_query:>9.2f}")
@@ -0,0 +1,203 @@
+"""
+End-to-end RAG benchmark
+Ingests a PDF into a scratch vector store and answers a fixed question set,
+timing each stage (extract, chunk, embed, store, retrieve, generate). Reports
+p50/p95/p99 latency, throughput and peak RSS, and writes the results as JSON.
+Passing a previous results file compares against it and exits non-zero when
+a stage got slower than the allowed tolerance.
+
+Usage: python benchmark_rag.py [--pdf docs.pdf] [--out results.json] [--baseline old.json] [--tolerance 0.2]
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from rag_system import RAGSystem
+
+QUESTIONS = [
+    "How do I create an index?",
+    "What does VACUUM do?",
+    "How are transactions isolated?",
+    "What is the default value of shared_buffers?",
+    "How do I grant privileges on a table to a role?",
+    "How do I back up a database?",
+    "What is a foreign key?",
+    "How does the query planner choose a join strategy?",
+]
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    values = np.asarray(samples, dtype=np.float64) * 1000.0
+    return {
+        'count': len(samples),
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95)),
+        'p99_ms': float(np.percentile(values, 99)),
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def benchmark_ingest(rag: RAGSystem, pdf_path: str) -> Dict:
+    """Run the ingestion stages one after another so each gets its own wall time."""
+    timings = {}
+
+    start = time.perf_counter()
+    pages = list(rag.doc_processor.iter_pdf_pages(pdf_path))
+    timings['extract_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunks = list(rag.chunker.chunk_pages(pages))
+    rag.vector_store.assign_chunk_ids(chunks, pdf_path)
+    timings['chunk_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    embeddings = rag.embedder.batch_embed([chunk['text'] for chunk in chunks])
+    timings['embed_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rag.store_chunks(chunks, embeddings)
+    rag.persist_indexes()
+    timings['store_s'] = time.perf_counter() - start
+
+    total = sum(timings.values())
+    return {
+        'pages': len(pages),
+        'chunks': len(chunks),
+        'tokens': int(sum(chunk.get('num_tokens', 0) for chunk in chunks)),
+        **timings,
+        'total_s': total,
+        'pages_per_s': len(pages) / timings['extract_s'] if timings['extract_s'] else 0.0,
+        'chunks_per_s': len(chunks) / timings['embed_s'] if timings['embed_s'] else 0.0,
+    }
+
+
+def benchmark_queries(rag: RAGSystem, questions: List[str], repeats: int, n_results: int,
+                      max_new_tokens: int) -> Dict:
+    retrieve, generate, end_to_end = [], [], []
+    new_tokens = 0
+
+    rag.warmup()
+    start_all = time.perf_counter()
+    for _ in range(repeats):
+        for question in questions:
+            start = time.perf_counter()
+            contexts = rag.pack_contexts(rag.retrieve(question, n_results=n_results))
+            retrieved = time.perf_counter()
+            answer = rag.generator.generate(rag.build_query_ids(question, contexts),
+                                            max_new_tokens=max_new_tokens, prefix=rag.system_prefix)
+            done = time.perf_counter()
+
+            retrieve.append(retrieved - start)
+            generate.append(done - retrieved)
+            end_to_end.append(done - start)
+            new_tokens += len(rag.generator.tokenizer(answer, add_special_tokens=False)['input_ids'])
+    elapsed = time.perf_counter() - start_all
+
+    return {
+        'retrieve': percentiles(retrieve),
+        'generate': percentiles(generate),
+        'end_to_end': percentiles(end_to_end),
+        'queries_per_s': len(end_to_end) / elapsed,
+        'generated_tokens_per_s': new_tokens / sum(generate) if generate else 0.0,
+    }
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Return the metrics that got slower than ``baseline`` by more than ``tolerance``."""
+    checks = [('ingest', key) for key in ('extract_s', 'chunk_s', 'embed_s', 'store_s', 'total_s')]
+    checks += [(stage, 'p95_ms') for stage in ('retrieve', 'generate', 'end_to_end')]
+
+    regressions = []
+    print(f"\n{'metric':<22} {'baseline':>10} {'current':>10} {'change':>8}")
+    for section, key in checks:
+        old = baseline.get(section, {}).get(key)
+        new = results.get(section, {}).get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        flag = " REGRESSION" if change > tolerance else ""
+        print(f"{section + '.' + key:<22} {old:>10.3f} {new:>10.3f} {change:>+7.1%}{flag}")
+        if flag:
+            regressions.append(f"{section}.{key}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end RAG benchmark")
+    parser.add_argument("--pdf", default="docs.pdf")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="previous results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before failing (0.2 = 20%%)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--vector-backend", default="chroma")
+    parser.add_argument("--hybrid", action="store_true")
+    args = parser.parse_args()
+
+    # Fresh stores and no embedding cache, so every run measures the full ingest.
+    scratch = tempfile.mkdtemp(prefix="rag_bench_")
+    rag = RAGSystem(window_size=3, overlap=1, embedding_cache_dir=None, pdf_workers=os.cpu_count(),
+                    vector_backend=args.vector_backend,
+                    vector_store_options={'persist_directory': os.path.join(scratch, "store")},
+                    hybrid=args.hybrid, lexical_index_path=os.path.join(scratch, "lexical_index.npz"))
+
+    ingest = benchmark_ingest(rag, args.pdf)
+    print(f"Ingest: {ingest['pages']} pages, {ingest['chunks']} chunks in {ingest['total_s']:.2f}s "
+          f"(extract {ingest['extract_s']:.2f}s, chunk {ingest['chunk_s']:.2f}s, "
+          f"embed {ingest['embed_s']:.2f}s, store {ingest['store_s']:.2f}s)")
+
+    queries = benchmark_queries(rag, QUESTIONS, args.repeats, args.n_results, args.max_new_tokens)
+    for stage in ('retrieve', 'generate', 'end_to_end'):
+        s = queries[stage]
+        print(f"{stage:<10} p50 {s['p50_ms']:8.1f} ms  p95 {s['p95_ms']:8.1f} ms  p99 {s['p99_ms']:8.1f} ms")
+    print(f"Throughput: {queries['queries_per_s']:.2f} queries/s, "
+          f"{queries['generated_tokens_per_s']:.1f} generated tokens/s")
+
+    results = {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'git_revision': git_revision(),
+        'host': {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'config': vars(args),
+        'ingest': ingest,
+        **queries,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    print(f"Peak RSS: {results['peak_rss_mb']:.0f} MB")
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,465 @@
+"""
+Multi-process ingestion pipeline for RAGSystem
+Runs extract+chunk and embed as separate process pools connected by bounded
+queues, with batched vector store writes and a manifest of ingested files
+that doubles as a resume checkpoint.
+
+    files --> [extract + chunk workers] --chunk_queue--> [embed workers] --write_queue--> writer (main process)
+
+Full queues block the stage that feeds them, so a slow stage throttles the
+ones before it instead of letting chunks pile up in memory.
+"""
+
+import fnmatch
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from rag_system import DocumentProcessor, NLTKTextChunker, VectorStore, make_embedder
+
+
+def _file_fingerprint(path: str) -> Dict:
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path: Optional[str]) -> Dict[str, Dict]:
+    if manifest_path and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(manifest_path: Optional[str], manifest: Dict[str, Dict]):
+    if not manifest_path:
+        return
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+
+def manifest_entry(path: str, pages: int = 0, chunks: int = 0, sha256: Optional[str] = None) -> Dict:
+    return {
+        **_file_fingerprint(path),
+        'sha256': sha256 or _file_sha256(path),
+        'pages': pages,
+        'chunks': chunks,
+        'ingested_at': time.time()
+    }
+
+
+def is_unchanged(path: str, entry: Optional[Dict]) -> bool:
+    """True if ``path`` matches its manifest ``entry``: same size and mtime,
+    or same size and content hash (then the entry's mtime is refreshed)."""
+    if not entry:
+        return False
+    fingerprint = _file_fingerprint(path)
+    if fingerprint == {'size': entry['size'], 'mtime': entry['mtime']}:
+        return True
+    if fingerprint['size'] == entry['size'] and _file_sha256(path) == entry.get('sha256'):
+        entry.update(fingerprint)  # touched but identical
+        return True
+    return False
+
+
+def find_documents(root: str, pattern: str = "*.pdf") -> List[str]:
+    """All files under ``root`` whose name matches ``pattern``, sorted."""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        paths.extend(os.path.join(dirpath, name) for name in sorted(filenames)
+                     if fnmatch.fnmatch(name.lower(), pattern.lower()))
+    return paths
+
+
+class _TimedPages:
+    """Wraps the page iterator to count pages and time spent extracting them."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.count = 0
+        self.seconds = 0.0
+
+    def __iter__(self):
+        iterator = iter(self.pages)
+        while True:
+            start = time.perf_counter()
+            try:
+                page = next(iterator)
+            except StopIteration:
+                self.seconds += time.perf_counter() - start
+                return
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            yield page
+
+
+def _extract_worker(file_queue, chunk_queue, write_queue, chunker_config: Dict, batch_size: int):
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(chunker_config['tokenizer'])
+    chunker = NLTKTextChunker(window_size=chunker_config['window_size'], overlap=chunker_config['overlap'],
+                              max_tokens=chunker_config['max_tokens'], tokenizer=tokenizer)
+    processor = DocumentProcessor()
+
+    while True:
+        job = file_queue.get()
+        if job is None:
+            break
+        path, existing = job
+        try:
+            info = {**_file_fingerprint(path), 'sha256': _file_sha256(path)}
+            start = time.perf_counter()
+
+            seen_digests = {}
+            seen_ids = []
+            num_chunks = 0
+            num_new = 0
+            batch = []
+
+            def flush(batch):
+                new_chunks, moved_chunks = VectorStore.diff_chunks(batch, existing)
+                if new_chunks:
+                    chunk_queue.put(('chunks', path, new_chunks))
+                if moved_chunks:
+                    write_queue.put(('moved', path, moved_chunks))
+                return len(new_chunks)
+
+            pages = _TimedPages(processor.iter_pdf_pages(path))
+            for chunk in chunker.chunk_pages(pages):
+                batch.append(chunk)
+                if len(batch) == batch_size:
+                    VectorStore.assign_chunk_ids(batch, path, seen_digests)
+                    seen_ids.extend(c['id'] for c in batch)
+                    num_chunks += len(batch)
+                    num_new += flush(batch)
+                    batch = []
+            if batch:
+                VectorStore.assign_chunk_ids(batch, path, seen_digests)
+                seen_ids.extend(c['id'] for c in batch)
+                num_chunks += len(batch)
+                num_new += flush(batch)
+
+            stale_ids = sorted(set(existing) - set(seen_ids))
+            # Whatever was not spent pulling pages went to chunking and diffing.
+            info.update({
+                'chunks': num_chunks,
+                'new': num_new,
+                'stale_ids': stale_ids,
+                'pages': pages.count,
+                'extract_s': pages.seconds,
+                'chunk_s': time.perf_counter() - start - pages.seconds
+            })
+        except Exception as e:
+            # A broken file must not take the worker (and every file queued behind it) down.
+            write_queue.put(('file_failed', path, f"{type(e).__name__}: {e}"))
+            continue
+        write_queue.put(('file_done', path, info))
+
+
+def _embed_worker(chunk_queue, write_queue, embedder_config: Dict, torch_threads: int):
+    import torch
+
+    torch.set_num_threads(torch_threads)
+    embedder = make_embedder(embedder_config['backend'], cache_dir=None, **embedder_config['options'])
+
+    while True:
+        job = chunk_queue.get()
+        if job is None:
+            break
+        _, path, chunks = job
+        start = time.perf_counter()
+        embeddings = embedder.batch_embed([chunk['text'] for chunk in chunks])
+        write_queue.put(('embedded', path, chunks, embeddings, time.perf_counter() - start))
+
+    write_queue.put(('embed_worker_done',))
+
+
+class IngestPipeline:
+    """Ingest many PDFs into ``rag.vector_store`` using every core.
+
+    ``extract_workers`` processes each take one file at a time, extract and
+    chunk it, and diff its chunks against what is already stored, so only
+    new chunks are sent on. ``embed_workers`` processes (default: one per
+    ``threads_per_embed_worker`` cores) embed them. The writer in the calling
+    process upserts in batches of ``write_batch_size``, applies moves and
+    deletes, and records each finished file in the manifest at
+    ``manifest_path`` (size, mtime, sha256, page and chunk counts).
+
+    On a rerun, files whose size and mtime match the manifest are skipped
+    without being opened, and files that were only touched are skipped after
+    a hash check, as long as the store still holds all of their chunks. A
+    file that was interrupted half-way only re-embeds chunks that never
+    reached the store. Files that fail to extract are listed in
+    ``stats['failed']`` and left out of the manifest, so the next run retries
+    them.
+    """
+
+    def __init__(self, rag, extract_workers: Optional[int] = None, embed_workers: Optional[int] = None,
+                 threads_per_embed_worker: int = 2, queue_size: int = 8, chunk_batch_size: int = 128,
+                 write_batch_size: int = 512, manifest_path: Optional[str] = "./ingest_manifest.json",
+                 progress_interval_s: float = 5.0):
+        cores = os.cpu_count() or 1
+        self.rag = rag
+        self.extract_workers = extract_workers or max(1, cores // 4)
+        self.threads_per_embed_worker = threads_per_embed_worker
+        self.embed_workers = embed_workers or max(1, cores // threads_per_embed_worker)
+        self.queue_size = queue_size
+        self.chunk_batch_size = chunk_batch_size
+        self.write_batch_size = write_batch_size
+        self.manifest_path = manifest_path
+        self.progress_interval_s = progress_interval_s
+
+    def _load_manifest(self) -> Dict[str, Dict]:
+        return load_manifest(self.manifest_path)
+
+    def _save_manifest(self, manifest: Dict[str, Dict]):
+        save_manifest(self.manifest_path, manifest)
+
+    def _is_unchanged(self, path: str, entry: Optional[Dict]) -> bool:
+        # Also require the store to still hold every chunk, as ingest_document does.
+        return is_unchanged(path, entry) and self.rag.vector_store.source_count(path) == entry['chunks']
+
+    def prune(self, manifest: Dict[str, Dict], root: str, paths: List[str]) -> int:
+        """Drop chunks of manifest files under ``root`` that are no longer in ``paths``."""
+        prefix = os.path.join(os.path.abspath(root), "")
+        current = set(paths)
+        removed = 0
+        for path in [p for p in manifest if os.path.abspath(p).startswith(prefix) and p not in current]:
+            stale_ids = list(self.rag.vector_store.get_source_metadata(path))
+            self.rag.delete_chunks(stale_ids)
+            removed += len(stale_ids)
+            del manifest[path]
+        if removed:
+            self._save_manifest(manifest)
+        return removed
+
+    def run(self, paths: List[str], prune_root: Optional[str] = None) -> Dict:
+        """Ingest ``paths``. With ``prune_root``, files under it that were
+        ingested before but are missing from ``paths`` are removed from the store."""
+        manifest = self._load_manifest()
+        todo = [path for path in paths if not self._is_unchanged(path, manifest.get(path))]
+        print(f"Ingest pipeline: {len(todo)} files to process, {len(paths) - len(todo)} unchanged since last run")
+
+        stats = {'files': 0, 'pages': 0, 'chunks': 0, 'new': 0, 'moved': 0, 'removed': 0,
+                 'skipped_files': len(paths) - len(todo), 'failed': {}, 'extract_s': 0.0, 'chunk_s': 0.0,
+                 'embed_s': 0.0, 'store_s': 0.0, 'wall_s': 0.0}
+        if prune_root is not None:
+            stats['removed'] += self.prune(manifest, prune_root, paths)
+        if not todo:
+            self._save_manifest(manifest)
+            self.rag.persist_indexes()
+            return stats
+
+        store = self.rag.vector_store
+        embedder = self.rag.embedder
+        chunker = self.rag.chunker
+        chunker_config = {
+            'tokenizer': embedder.model_name,
+            'window_size': chunker.window_size,
+            'overlap': chunker.overlap,
+            'max_tokens': chunker.max_tokens
+        }
+        embedder_config = {
+            'backend': self.rag.embedding_backend,
+            'options': {**self.rag.embedding_options, 'runtime': embedder.runtime}
+        }
+
+        # The main process owns the store; workers only get a snapshot of what it
+        # already holds for their file, taken as the file is queued.
+        store_lock = threading.Lock()
+
+        ctx = mp.get_context("spawn")
+        file_queue = ctx.Queue(maxsize=self.queue_size)
+        chunk_queue = ctx.Queue(maxsize=self.queue_size)
+        write_queue = ctx.Queue(maxsize=self.queue_size)
+
+        extractors = [
+            ctx.Process(target=_extract_worker,
+                        args=(file_queue, chunk_queue, write_queue, chunker_config, self.chunk_batch_size))
+            for _ in range(min(self.extract_workers, len(todo)))
+        ]
+        embedders = [
+            ctx.Process(target=_embed_worker,
+                        args=(chunk_queue, write_queue, embedder_config, self.threads_per_embed_worker))
+            for _ in range(self.embed_workers)
+        ]
+        for process in extractors + embedders:
+            process.start()
+
+        def put_file(item) -> bool:
+            # Give up once every extractor is gone, rather than block forever.
+            while any(process.is_alive() for process in extractors):
+                try:
+                    file_queue.put(item, timeout=1.0)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def coordinate():
+            for path in todo:
+                with store_lock:
+                    existing = store.get_source_metadata(path)
+                if not put_file((path, existing)):
+                    break
+            for _ in extractors:
+                put_file(None)
+            for process in extractors:
+                process.join()
+            # Every chunk is queued once the extractors are gone; tell the embedders to finish.
+            for _ in embedders:
+                chunk_queue.put(None)
+
+        coordinator = threading.Thread(target=coordinate, daemon=True)
+        coordinator.start()
+
+        start = time.perf_counter()
+        last_report = start
+        pending_chunks: List[Dict] = []
+        pending_embeddings: List[np.ndarray] = []
+        written: Dict[str, int] = {}
+        finished: Dict[str, Dict] = {}
+        reported = set()
+        embedders_running = len(embedders)
+
+        def flush_writes():
+            if not pending_chunks:
+                return
+            store_start = time.perf_counter()
+            with store_lock:
+                self.rag.store_chunks(pending_chunks, np.concatenate(pending_embeddings))
+            stats['store_s'] += time.perf_counter() - store_start
+            for chunk in pending_chunks:
+                written[chunk['source']] = written.get(chunk['source'], 0) + 1
+            pending_chunks.clear()
+            pending_embeddings.clear()
+
+        def finalize_ready_files(force: bool = False):
+            for path in list(finished):
+                info = finished[path]
+                if written.get(path, 0) < info['new'] and not force:
+                    continue
+                store_start = time.perf_counter()
+                with store_lock:
+                    self.rag.delete_chunks(info['stale_ids'])
+                stats['store_s'] += time.perf_counter() - store_start
+                manifest[path] = {
+                    'size': info['size'],
+                    'mtime': info['mtime'],
+                    'sha256': info['sha256'],
+                    'pages': info['pages'],
+                    'chunks': info['chunks'],
+                    'ingested_at': time.time()
+                }
+                self._save_manifest(manifest)
+                stats['files'] += 1
+                for key in ('pages', 'chunks', 'new', 'extract_s', 'chunk_s'):
+                    stats[key] += info[key]
+                stats['removed'] += len(info['stale_ids'])
+                del finished[path]
+
+        while embedders_running:
+            try:
+                message = write_queue.get(timeout=self.progress_interval_s)
+            except queue.Empty:
+                # Embedders are what the loop waits on; losing one would hang it.
+                failed = [p for p in embedders if p.exitcode not in (None, 0)]
+                if failed:
+                    for process in extractors + embedders:
+                        process.terminate()
+                    raise RuntimeError(f"{len(failed)} ingest worker(s) died; rerun to resume from the manifest")
+                continue
+            kind = message[0]
+            if kind == 'embedded':
+                _, path, chunks, embeddings, embed_s = message
+                pending_chunks.extend(chunks)
+                pending_embeddings.append(embeddings)
+                stats['embed_s'] += embed_s
+                if len(pending_chunks) >= self.write_batch_size:
+                    flush_writes()
+            elif kind == 'moved':
+                store_start = time.perf_counter()
+                with store_lock:
+                    store.update_metadata(message[2])
+                stats['store_s'] += time.perf_counter() - store_start
+                stats['moved'] += len(message[2])
+            elif kind == 'file_done':
+                reported.add(message[1])
+                finished[message[1]] = message[2]
+                flush_writes()
+            elif kind == 'file_failed':
+                reported.add(message[1])
+                stats['failed'][message[1]] = message[2]
+                print(f"[pipeline] failed to ingest {message[1]}: {message[2]}")
+            elif kind == 'embed_worker_done':
+                embedders_running -= 1
+            finalize_ready_files()
+
+            now = time.perf_counter()
+            if now - last_report >= self.progress_interval_s:
+                last_report = now
+                embedded = sum(written.values()) + len(pending_chunks)
+                print(f"[pipeline] {stats['files']}/{len(todo)} files, {embedded} chunks embedded "
+                      f"({embedded / (now - start):.1f}/s), {len(finished)} files awaiting writes")
+
+        flush_writes()
+        finalize_ready_files(force=True)
+        coordinator.join()
+        for process in embedders:
+            process.join()
+        # An extractor that crashed outright loses the file it was working on.
+        crashed = [p.exitcode for p in extractors if p.exitcode != 0]
+        if crashed:
+            for path in todo:
+                if path not in reported:
+                    stats['failed'][path] = f"extract worker exited with code {crashed[0]}"
+        self.rag.persist_indexes()
+
+        stats['wall_s'] = time.perf_counter() - start
+        return stats
+
+
+def format_report(stats: Dict) -> str:
+    """Per-stage summary of an ``IngestPipeline.run`` result.
+
+    Stage seconds are summed over workers, so with several workers they can
+    exceed the wall-clock time; the rate column is items per worker-second.
+    """
+    def rate(items, seconds):
+        return f"{items / seconds:>10.1f}" if seconds > 0 else f"{'-':>10}"
+
+    rows = [
+        ("extract", "pages", stats['pages'], stats['extract_s']),
+        ("chunk", "chunks", stats['chunks'], stats['chunk_s']),
+        ("embed", "chunks", stats['new'], stats['embed_s']),
+        ("store", "chunks", stats['new'] + stats['moved'] + stats['removed'], stats['store_s']),
+        ("total", "files", stats['files'], stats['wall_s']),
+    ]
+    lines = [
+        f"Files: {stats['files']} ingested, {stats['skipped_files']} unchanged | "
+        f"chunks: {stats['new']} new, {stats['moved']} moved, {stats['removed']} removed",
+    ]
+    if stats['failed']:
+        lines.append(f"Failed: {len(stats['failed'])} files (retried on the next run)")
+        lines.extend(f"  {path}: {error}" for path, error in sorted(stats['failed'].items()))
+    lines.append(f"{'stage':<8} {'items':>10} {'unit':<7} {'seconds':>9} {'per sec':>10}")
+    for stage, unit, items, seconds in rows:
+        lines.append(f"{stage:<8} {items:>10} {unit:<7} {seconds:>9.2f} {rate(items, seconds)}")
+    return "\n".join(lines)
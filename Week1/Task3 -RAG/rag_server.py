@@ -0,0 +1,306 @@
+"""
+Async HTTP service for RAGSystem
+Concurrent requests are merged into micro-batches for query embedding and
+for (non-streaming) generation, so one replica serves many users at once.
+
+Endpoints:
+    GET  /health  -> {"status": "ok", ...}
+    GET  /metrics -> Prometheus text, when telemetry is enabled
+    POST /query   {"question": "...", "n_results": 3, "max_new_tokens": 200, "stream": false}
+                  -> {"answer", "contexts", "stats"}, or NDJSON lines {"token": ...}
+                     followed by {"done": true, "stats": ...} when "stream" is true
+
+``max_new_tokens`` is capped at ``--max-new-tokens-limit``.
+
+Usage: python rag_server.py [--port 8080] [--max-wait-ms 10] [--max-batch-size 16] [--ingest docs.pdf]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Optional
+
+from aiohttp import web
+
+import telemetry
+from rag_system import RAGSystem, AnswerCache
+
+
+def _public_contexts(contexts: List[Dict]) -> List[Dict]:
+    """Contexts as sent to clients, without the LLM token ids kept for prompt building."""
+    return [{key: value for key, value in ctx.items() if key != 'token_ids'} for ctx in contexts]
+
+
+class MicroBatcher:
+    """Collects concurrent ``submit`` calls into one ``batch_fn`` call.
+
+    A batch is dispatched when it reaches ``max_batch_size`` items or when
+    its oldest item has waited ``max_wait_ms``. ``batch_fn`` takes a list of
+    items, returns one result per item, and runs on ``executor`` so the
+    event loop never blocks on model code.
+    """
+
+    def __init__(self, batch_fn: Callable[[List], List], executor: ThreadPoolExecutor,
+                 max_batch_size: int = 16, max_wait_ms: float = 10.0):
+        self.batch_fn = batch_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+        self.batch_sizes: List[int] = []
+        self._queue: Optional[asyncio.Queue] = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait_s
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.batch_sizes.append(len(batch))
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.batch_fn, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class RAGServer:
+    def __init__(self, rag: RAGSystem, max_batch_size: int = 16, max_wait_ms: float = 10.0,
+                 max_inflight: int = 64, max_concurrent_streams: int = 4, max_new_tokens_limit: int = 512):
+        self.rag = rag
+        self.max_inflight = max_inflight
+        self.max_new_tokens_limit = max_new_tokens_limit
+        self.inflight = 0
+        self.served = 0
+        self.started_at = time.time()
+        self.stream_slots = asyncio.Semaphore(max_concurrent_streams)
+
+        # The embedder is only called from its single thread. The LLM generator serializes its own
+        # tokenizer and model calls, so the extra generate threads only let streams and batches
+        # wait for the model without tying up the event loop or the embed thread.
+        self.embed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        self.generate_executor = ThreadPoolExecutor(max_workers=max_concurrent_streams + 1,
+                                                    thread_name_prefix="generate")
+        self.embed_batcher = MicroBatcher(self._embed_batch, self.embed_executor, max_batch_size, max_wait_ms)
+        self.generate_batcher = MicroBatcher(self._generate_batch, self.generate_executor,
+                                             max_batch_size, max_wait_ms)
+
+    def _embed_batch(self, questions: List[str]) -> List:
+        return list(self.rag.embedder.batch_embed(questions))
+
+    def _generate_batch(self, jobs: List[Dict]) -> List[str]:
+        # Jobs in one micro-batch may ask for different lengths; each answer is cut to its own.
+        return self.rag.generator.generate_batch([job['prompt'] for job in jobs],
+                                                 max_new_tokens=[job['max_new_tokens'] for job in jobs],
+                                                 temperature=0.7, batch_size=len(jobs))
+
+    def _prepare(self, question: str, embedding, n_results: int, max_new_tokens: int) -> Dict:
+        """Answer-cache lookup, retrieval and context packing for one request (runs off the event loop)."""
+        rag = self.rag
+        params = (n_results, max_new_tokens)
+        if rag.answer_cache is not None:
+            cached = rag.answer_cache.get(embedding, params)
+            if cached is not None:
+                return {'cached': cached}
+        contexts = rag.pack_contexts(rag.retrieve(question, n_results=n_results, query_embedding=embedding))
+        return {'contexts': contexts, 'params': params}
+
+    async def startup(self, app):
+        self.embed_batcher.start()
+        self.generate_batcher.start()
+
+    async def shutdown(self, app):
+        await self.embed_batcher.stop()
+        await self.generate_batcher.stop()
+        self.embed_executor.shutdown(wait=False)
+        self.generate_executor.shutdown(wait=False)
+
+    async def health(self, request: web.Request) -> web.Response:
+        batches = self.embed_batcher.batch_sizes
+        return web.json_response({
+            'status': 'ok',
+            'uptime_s': time.time() - self.started_at,
+            'inflight': self.inflight,
+            'served': self.served,
+            'mean_embed_batch': sum(batches) / len(batches) if batches else 0.0,
+            'answer_cache': self.rag.answer_cache.stats() if self.rag.answer_cache is not None else None
+        })
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        if not telemetry.enabled():
+            return web.Response(status=404, text="telemetry is disabled\n")
+        return web.Response(text=telemetry.prometheus_text(), content_type="text/plain")
+
+    async def query(self, request: web.Request) -> web.StreamResponse:
+        if self.inflight >= self.max_inflight:
+            return web.json_response({'error': 'server busy'}, status=503)
+        try:
+            body = await request.json()
+            question = str(body['question'])
+        except (ValueError, KeyError, TypeError):
+            return web.json_response({'error': 'expected JSON body with a "question" field'}, status=400)
+        try:
+            n_results = int(body.get('n_results', 3))
+            max_new_tokens = int(body.get('max_new_tokens', 200))
+        except (ValueError, TypeError):
+            return web.json_response({'error': '"n_results" and "max_new_tokens" must be integers'}, status=400)
+        if n_results < 1 or max_new_tokens < 1:
+            return web.json_response({'error': '"n_results" and "max_new_tokens" must be positive'}, status=400)
+        max_new_tokens = min(max_new_tokens, self.max_new_tokens_limit)
+
+        self.inflight += 1
+        try:
+            start = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            embedding = await self.embed_batcher.submit(question)
+            prepared = await loop.run_in_executor(self.embed_executor, self._prepare, question, embedding,
+                                                  n_results, max_new_tokens)
+            stats = {'retrieve_s': time.perf_counter() - start}
+
+            if body.get('stream'):
+                return await self._stream(request, question, embedding, prepared, stats, max_new_tokens, start)
+
+            if 'cached' in prepared:
+                answer, contexts = prepared['cached']['answer'], prepared['cached']['contexts']
+                stats['cache_hit'] = True
+            else:
+                contexts = prepared['contexts']
+                prompt = self.rag.build_prompt(question, contexts)
+                answer = await self.generate_batcher.submit({'prompt': prompt, 'max_new_tokens': max_new_tokens})
+                stats['cache_hit'] = False
+                if self.rag.answer_cache is not None:
+                    self.rag.answer_cache.put(embedding, answer, contexts, prepared['params'])
+            stats['total_s'] = time.perf_counter() - start
+            self.served += 1
+            return web.json_response({'answer': answer, 'contexts': _public_contexts(contexts), 'stats': stats})
+        finally:
+            self.inflight -= 1
+
+    async def _stream(self, request, question, embedding, prepared, stats, max_new_tokens, start):
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+
+        async def send(payload: Dict):
+            await response.write((json.dumps(payload) + "\n").encode("utf-8"))
+
+        if 'cached' in prepared:
+            await send({'token': prepared['cached']['answer']})
+            stats.update({'cache_hit': True, 'total_s': time.perf_counter() - start})
+            await send({'done': True, 'stats': stats})
+            await response.write_eof()
+            self.served += 1
+            return response
+
+        contexts = prepared['contexts']
+        query_ids = self.rag.build_query_ids(question, contexts)
+        loop = asyncio.get_running_loop()
+        tokens: asyncio.Queue = asyncio.Queue()
+        gen_stats = {}
+        stop = threading.Event()
+
+        def produce():
+            # Runs on a generator thread; hands tokens to the event loop as they appear.
+            try:
+                for piece in self.rag.generator.stream(query_ids, max_new_tokens=max_new_tokens, temperature=0.7,
+                                                       stats=gen_stats, prefix=self.rag.system_prefix,
+                                                       stop_event=stop):
+                    loop.call_soon_threadsafe(tokens.put_nowait, piece)
+            finally:
+                loop.call_soon_threadsafe(tokens.put_nowait, None)
+
+        pieces = []
+        async with self.stream_slots:
+            producer = loop.run_in_executor(self.generate_executor, produce)
+            try:
+                while True:
+                    piece = await tokens.get()
+                    if piece is None:
+                        break
+                    if not pieces:
+                        stats['ttft_s'] = time.perf_counter() - start
+                    pieces.append(piece)
+                    await send({'token': piece})
+            finally:
+                # If send() failed because the client disconnected, stop generating
+                # (freeing the model) and wait for the generator thread before leaving.
+                stop.set()
+                await producer
+
+        stats.update({key: gen_stats[key] for key in ('new_tokens', 'tokens_per_s') if key in gen_stats})
+        stats.update({'cache_hit': False, 'total_s': time.perf_counter() - start})
+        if self.rag.answer_cache is not None:
+            self.rag.answer_cache.put(embedding, "".join(pieces), contexts, prepared['params'])
+        await send({'done': True, 'stats': stats, 'contexts': _public_contexts(contexts)})
+        await response.write_eof()
+        self.served += 1
+        return response
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/health", self.health)
+        app.router.add_get("/metrics", self.metrics)
+        app.router.add_post("/query", self.query)
+        app.on_startup.append(self.startup)
+        app.on_cleanup.append(self.shutdown)
+        return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve RAGSystem over HTTP")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--max-inflight", type=int, default=64)
+    parser.add_argument("--max-concurrent-streams", type=int, default=4)
+    parser.add_argument("--max-new-tokens-limit", type=int, default=512,
+                        help="upper bound on a request's max_new_tokens")
+    parser.add_argument("--ingest", help="PDF file or directory to ingest before serving")
+    parser.add_argument("--embedding-backend", default="minilm",
+                        help="embedder for retrieval and the answer cache (the cache needs a normalized one)")
+    args = parser.parse_args()
+
+    rag = RAGSystem(window_size=3, overlap=1, answer_cache=AnswerCache(), embedding_backend=args.embedding_backend,
+                    hybrid=True)
+    if args.ingest:
+        if os.path.isdir(args.ingest):
+            rag.ingest_directory(args.ingest)
+        else:
+            rag.ingest_document(args.ingest)
+    rag.warmup()
+
+    server = RAGServer(rag, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+                       max_inflight=args.max_inflight, max_concurrent_streams=args.max_concurrent_streams,
+                       max_new_tokens_limit=args.max_new_tokens_limit)
+    web.run_app(server.make_app(), host=args.host, port=args.port)
@@ -3,15 +3,36 @@ RAG System for PostgreSQL Documentation
 Processes Word documents, creates embeddings, and enables semantic search
 """
 
+import atexit
+import copy
+import hashlib
+import heapq
+import json
+import os
+import re
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
 import numpy as np
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, Iterator, Iterable, Union
 
 import nltk
 from nltk.tokenize import sent_tokenize
 
 import torch
-from transformers import BertTokenizer, BertModel
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoModel
+from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer
+from transformers import StoppingCriteria, StoppingCriteriaList
+try:
+    from transformers import DynamicCache
+except ImportError:  # transformers < 4.36 returns tuple KV caches
+    DynamicCache = None
 import chromadb
 from chromadb.config import Settings
 
@@ -24,34 +45,360 @@ except LookupError:
 
 from PyPDF2 import PdfReader
 
+import telemetry
+from prompt_templates import CompiledTemplate
+
 LLM_MODEL = "Qwen/Qwen2.5-0.5B-Instruct"
-llm = AutoModelForCausalLM.from_pretrained(
-    LLM_MODEL,
-    device_map="auto",
-    torch_dtype=torch.float16
-)
+
+
+class _CountingStreamer(TextIteratorStreamer):
+    """TextIteratorStreamer that also counts generated (non-prompt) tokens."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num_tokens = 0
+
+    def put(self, value):
+        if not (self.skip_prompt and self.next_tokens_are_prompt):
+            self.num_tokens += value.numel()
+        super().put(value)
+
+
+class _StopOnEvent(StoppingCriteria):
+    """Stops ``generate`` once ``event`` is set, e.g. when the client has gone away."""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+class _LockedTokenizer:
+    """Wraps a Hugging Face tokenizer so calls from several threads take turns.
+
+    Fast tokenizers are Rust objects that raise "Already borrowed" when one
+    thread changes padding/truncation while another is encoding or decoding.
+    Attribute reads and method calls go through ``lock``; everything else
+    behaves like the wrapped tokenizer.
+    """
+
+    def __init__(self, tokenizer):
+        object.__setattr__(self, '_tokenizer', tokenizer)
+        object.__setattr__(self, 'lock', threading.RLock())
+
+    def __call__(self, *args, **kwargs):
+        with self.lock:
+            return self._tokenizer(*args, **kwargs)
+
+    def __getattr__(self, name):
+        with self.lock:
+            attr = getattr(self._tokenizer, name)
+        if not callable(attr):
+            return attr
+
+        def locked(*args, **kwargs):
+            with self.lock:
+                return attr(*args, **kwargs)
+        return locked
+
+    def __setattr__(self, name, value):
+        with self.lock:
+            setattr(self._tokenizer, name, value)
+
+
+class LLMGenerator:
+    """Owns the causal LM and its tokenizer.
+
+    Use ``get_generator()`` rather than constructing this directly so the
+    model is loaded once per process, and only when something first needs it.
+    The generator may be shared between threads: tokenizer calls are
+    serialized by the tokenizer wrapper and ``model.generate`` calls by
+    ``model_lock``, so concurrent requests queue for the model.
+    """
+
+    def __init__(self, model_name: str = LLM_MODEL):
+        self.model_name = model_name
+        print(f"Loading LLM: {model_name}")
+        self.tokenizer = _LockedTokenizer(AutoTokenizer.from_pretrained(model_name))
+        self.model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            device_map="auto",
+            torch_dtype=torch.float16
+        )
+        self.model.eval()
+        # Batched generation needs left padding so every prompt ends where generation starts.
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        # prefix text -> (prefix input ids, KV cache after prefilling them)
+        self._prefix_caches: Dict[str, Tuple] = {}
+        self._prefix_lock = threading.Lock()
+        self.model_lock = threading.Lock()
+
+    @property
+    def device(self):
+        return self.model.device
+
+    def prefix_cache(self, prefix: str) -> Tuple:
+        """Prefill ``prefix`` once and keep its input ids and KV cache."""
+        cached = self._prefix_caches.get(prefix)
+        if cached is None:
+            with self._prefix_lock:
+                cached = self._prefix_caches.get(prefix)
+                if cached is None:
+                    prefix_ids = self.tokenizer(prefix, return_tensors="pt")['input_ids'].to(self.device)
+                    kwargs = {'past_key_values': DynamicCache()} if DynamicCache is not None else {}
+                    with self.model_lock, torch.no_grad():
+                        past = self.model(input_ids=prefix_ids, use_cache=True, **kwargs).past_key_values
+                    cached = (prefix_ids, past)
+                    self._prefix_caches[prefix] = cached
+        return cached
+
+    def _prepare(self, prompt: Union[str, List[int]], prefix: Optional[str]) -> Dict:
+        """Build ``generate`` kwargs for ``prefix + prompt``.
+
+        With a prefix, its cached KV is passed in so only ``prompt`` is
+        prefilled. The prompt is tokenized separately from the prefix so the
+        token boundary matches the cached prefix exactly. ``prompt`` may also
+        be a list of token ids (e.g. from a ``CompiledTemplate``), used as-is.
+        """
+        if prefix is None:
+            if isinstance(prompt, list):
+                input_ids = torch.tensor([prompt], device=self.device)
+                return {'input_ids': input_ids, 'attention_mask': torch.ones_like(input_ids)}
+            return dict(self.tokenizer(prompt, return_tensors="pt").to(self.device))
+
+        prefix_ids, past = self.prefix_cache(prefix)
+        if isinstance(prompt, list):
+            suffix_ids = torch.tensor([prompt])
+        else:
+            suffix_ids = self.tokenizer(prompt, add_special_tokens=False, return_tensors="pt")['input_ids']
+        input_ids = torch.cat([prefix_ids, suffix_ids.to(self.device)], dim=1)
+        return {
+            'input_ids': input_ids,
+            'attention_mask': torch.ones_like(input_ids),
+            # generate extends the cache in place, so every call needs its own copy
+            'past_key_values': copy.deepcopy(past)
+        }
+
+    def generate(self, prompt: Union[str, List[int]], max_new_tokens: int = 200, temperature: float = 0.7,
+                 prefix: Optional[str] = None) -> str:
+        """Generate a completion for ``prefix + prompt`` and return only the new text."""
+        with telemetry.span("generate", batch=1):
+            inputs = self._prepare(prompt, prefix)
+            with self.model_lock, torch.no_grad():
+                outputs = self.model.generate(
+                    **inputs,
+                    max_new_tokens=max_new_tokens,
+                    temperature=temperature
+                )
+        new_tokens = outputs[0][inputs['input_ids'].shape[1]:]
+        telemetry.count("rag_generated_tokens_total", len(new_tokens))
+        return self.tokenizer.decode(new_tokens, skip_special_tokens=True)
+
+    def generate_batch(self, prompts: List[str], max_new_tokens: Union[int, List[int]] = 200,
+                       temperature: float = 0.7, batch_size: int = 8) -> List[str]:
+        """Generate answers for many prompts with left-padded batched ``generate`` calls.
+
+        ``max_new_tokens`` may be a list with one limit per prompt; each batch
+        generates up to its largest limit and every answer is cut to its own.
+        """
+        limits = max_new_tokens if isinstance(max_new_tokens, list) else [max_new_tokens] * len(prompts)
+        answers = []
+        for i in range(0, len(prompts), batch_size):
+            batch = prompts[i:i + batch_size]
+            batch_limits = limits[i:i + batch_size]
+            telemetry.observe("rag_generate_batch_size", len(batch))
+            with telemetry.span("generate", batch=len(batch)):
+                inputs = self.tokenizer(batch, return_tensors="pt", padding=True).to(self.device)
+                with self.model_lock, torch.no_grad():
+                    outputs = self.model.generate(
+                        **inputs,
+                        max_new_tokens=max(batch_limits),
+                        temperature=temperature,
+                        pad_token_id=self.tokenizer.pad_token_id
+                    )
+            new_tokens = [row[:limit] for row, limit in zip(outputs[:, inputs['input_ids'].shape[1]:], batch_limits)]
+            telemetry.count("rag_generated_tokens_total",
+                            sum(int((row != self.tokenizer.pad_token_id).sum()) for row in new_tokens))
+            answers.extend(self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True))
+        return answers
+
+    def stream(self, prompt: Union[str, List[int]], max_new_tokens: int = 200, temperature: float = 0.7,
+               stats: Optional[Dict] = None, prefix: Optional[str] = None,
+               stop_event: Optional[threading.Event] = None) -> Iterator[str]:
+        """Yield answer text as it is generated.
+
+        ``model.generate`` runs on a background thread and feeds a streamer;
+        the prompt is not echoed. If ``stats`` is given it is filled with
+        ``ttft_s``, ``total_s``, ``new_tokens`` and ``tokens_per_s`` once the
+        stream is exhausted. ``prefix`` works as in ``generate``. Setting
+        ``stop_event`` (or closing the iterator) ends generation after the
+        current token, releasing the model for other requests.
+        """
+        start = time.perf_counter()
+        inputs = self._prepare(prompt, prefix)
+        streamer = _CountingStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        stop_event = stop_event or threading.Event()
+        errors = []
+
+        def run():
+            try:
+                with self.model_lock, torch.no_grad():
+                    self.model.generate(
+                        **inputs,
+                        max_new_tokens=max_new_tokens,
+                        temperature=temperature,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([_StopOnEvent(stop_event)])
+                    )
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                # generate() only ends the stream when it returns normally; without this
+                # a failure would leave the consumer below waiting forever.
+                streamer.end()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+
+        first_token_at = None
+        try:
+            for text in streamer:
+                if not text:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                yield text
+        finally:
+            # Only has an effect when the consumer stopped early.
+            stop_event.set()
+            thread.join()
+        if errors:
+            raise errors[0]
+
+        total = time.perf_counter() - start
+        if stats is not None:
+            ttft = (first_token_at - start) if first_token_at is not None else total
+            stats.update({
+                'prompt_tokens': int(inputs['input_ids'].shape[1]),
+                'new_tokens': streamer.num_tokens,
+                'ttft_s': ttft,
+                'total_s': total,
+                'tokens_per_s': streamer.num_tokens / total if total > 0 else 0.0,
+                'decode_tokens_per_s': (streamer.num_tokens / (total - ttft)) if total > ttft else 0.0
+            })
+        telemetry.count("rag_generated_tokens_total", streamer.num_tokens)
+        telemetry.observe("rag_generate_seconds", total)
+        if first_token_at is not None:
+            telemetry.observe("rag_ttft_seconds", first_token_at - start)
+
+    def warmup(self, prompt: str = "Hello", max_new_tokens: int = 4, prefix: Optional[str] = None):
+        """Run a tiny generation so kernels and caches (including the prefix
+        KV cache, if given) are ready before the first query."""
+        self.generate(prompt, max_new_tokens=max_new_tokens, prefix=prefix)
+
+
+_generators: Dict[str, LLMGenerator] = {}
+_generators_lock = threading.Lock()
+
+
+def get_generator(model_name: str = LLM_MODEL) -> LLMGenerator:
+    generator = _generators.get(model_name)
+    if generator is None:
+        with _generators_lock:
+            generator = _generators.get(model_name)
+            if generator is None:
+                generator = LLMGenerator(model_name)
+                _generators[model_name] = generator
+    return generator
+
+
+def _extract_page_range(file_path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    # Runs in a worker process: each worker opens its own reader.
+    reader = PdfReader(file_path)
+    pages = []
+    for page_number in range(start, stop):
+        text = reader.pages[page_number].extract_text()
+        if text and text.strip():
+            pages.append((page_number + 1, text))
+    return pages
+
 
 class DocumentProcessor:    
-    def __init__(self):
+    def __init__(self, workers: Optional[int] = None, pages_per_task: int = 16):
         self.documents = []
+        self.workers = workers
+        self.pages_per_task = pages_per_task
+
+    def iter_pdf_pages(self, file_path: str) -> Iterator[Tuple[int, str]]:
+        """Yield ``(page_number, text)`` for every non-empty page, in order.
+
+        Page numbers are 1-based. With ``workers`` > 1 the pages are split into
+        ranges of ``pages_per_task`` and extracted on a process pool; results
+        are still yielded in page order as soon as each range is ready. At most
+        ``2 * workers`` ranges are in flight, so a slow consumer does not make
+        the pool extract (and hold) the whole document ahead of it.
+        """
+        num_pages = len(PdfReader(file_path).pages)
+
+        if not self.workers or self.workers <= 1 or num_pages <= self.pages_per_task:
+            yield from _extract_page_range(file_path, 0, num_pages)
+            return
+
+        ranges = ((start, min(start + self.pages_per_task, num_pages))
+                  for start in range(0, num_pages, self.pages_per_task))
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            in_flight = deque(pool.submit(_extract_page_range, file_path, start, stop)
+                              for start, stop in islice(ranges, 2 * self.workers))
+            try:
+                while in_flight:
+                    pages = in_flight.popleft().result()
+                    for start, stop in islice(ranges, 1):
+                        in_flight.append(pool.submit(_extract_page_range, file_path, start, stop))
+                    yield from pages
+            finally:
+                for future in in_flight:
+                    future.cancel()
     
     def load_pdf_document(self, file_path: str) -> str:
-        reader = PdfReader(file_path)
-        full_text = []
-        
-        for page in reader.pages:
-            text = page.extract_text()
-            if text and text.strip():
-                full_text.append(text)
-        
-        return "\n".join(full_text)
+        return "\n".join(text for _, text in self.iter_pdf_pages(file_path))
 
 
 
 class NLTKTextChunker:    
-    def __init__(self, window_size: int = 3, overlap: int = 1):
+    def __init__(self, window_size: int = 3, overlap: int = 1, max_tokens: Optional[int] = None,
+                 tokenizer=None):
+        """``max_tokens`` caps each streamed window at that many ``tokenizer``
+        tokens (excluding special tokens), on top of the ``window_size``
+        sentence limit. Both must be given together."""
+        if (max_tokens is None) != (tokenizer is None):
+            raise ValueError("max_tokens and tokenizer must be given together")
         self.window_size = window_size
         self.overlap = overlap
+        self.max_tokens = max_tokens
+        self.tokenizer = tokenizer
+
+    def count_tokens(self, text: str) -> int:
+        if self.tokenizer is None:
+            return 0
+        return len(self.tokenizer(text, add_special_tokens=False)['input_ids'])
+
+    def _split_long_sentence(self, sentence: str) -> Iterator[Tuple[str, int]]:
+        # Greedily pack words so no piece exceeds the token budget on its own.
+        piece = []
+        piece_tokens = 0
+        for word in sentence.split():
+            word_tokens = self.count_tokens(word)
+            if piece and piece_tokens + word_tokens > self.max_tokens:
+                yield " ".join(piece), piece_tokens
+                piece = []
+                piece_tokens = 0
+            piece.append(word)
+            piece_tokens += word_tokens
+        if piece:
+            yield " ".join(piece), piece_tokens
     
     def chunk_text(self, text: str) -> List[Dict[str, any]]:
         sentences = sent_tokenize(text)
@@ -79,84 +426,530 @@ class NLTKTextChunker:
         
         return chunks
 
+    def chunk_pages(self, pages: Iterable[Tuple[int, str]]) -> Iterator[Dict]:
+        """Chunk a stream of ``(page_number, text)`` pages lazily.
 
-class BERTEmbedder:
-    
-    def __init__(self, model_name: str = 'bert-base-uncased'):
-        print(f"Loading BERT model: {model_name}")
-        self.tokenizer = BertTokenizer.from_pretrained(model_name)
-        self.model = BertModel.from_pretrained(model_name)
-        self.model.eval() 
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model.to(self.device)
+        Sentences are tokenized one page at a time and never span a page
+        boundary. Each chunk also records ``page_start`` and ``page_end``.
+        """
+        def sentences():
+            for page_number, text in pages:
+                telemetry.count("rag_pages_total")
+                for sentence in sent_tokenize(text):
+                    yield page_number, sentence
+
+        return self.chunk_sentences(sentences())
+
+    def chunk_sentences(self, sentences: Iterable[Tuple[int, str]]) -> Iterator[Dict]:
+        """Turn a stream of ``(page_number, sentence)`` into sliding windows.
+
+        Runs in O(number of sentences) and only ever holds one window. Without
+        a token budget the windows match ``chunk_text``. With ``max_tokens`` a
+        window is also closed before it would exceed the budget, so the
+        embedder never truncates a chunk; sentences longer than the budget are
+        split on word boundaries.
+        """
+        step = self.window_size - self.overlap
+        window = deque()  # (sentence_index, page_number, sentence, num_tokens)
+        window_tokens = 0
+        fresh = 0  # sentences in the window not yet emitted in any chunk
+        sentence_index = 0
+        chunk_id = 0
+
+        def emit():
+            telemetry.count("rag_chunks_total")
+            telemetry.count("rag_chunk_tokens_total", window_tokens)
+            return {
+                'text': " ".join(item[2] for item in window),
+                'start_sentence': window[0][0],
+                'end_sentence': window[-1][0] + 1,
+                'num_sentences': len(window),
+                'num_tokens': window_tokens,
+                'page_start': window[0][1],
+                'page_end': window[-1][1],
+                'chunk_id': chunk_id
+            }
+
+        def pieces():
+            for page_number, sentence in sentences:
+                if self.max_tokens is None:
+                    yield page_number, sentence, 0
+                    continue
+                num_tokens = self.count_tokens(sentence)
+                if num_tokens <= self.max_tokens:
+                    yield page_number, sentence, num_tokens
+                else:
+                    for piece, piece_tokens in self._split_long_sentence(sentence):
+                        yield page_number, piece, piece_tokens
+
+        for page_number, sentence, num_tokens in pieces():
+            if self.max_tokens is not None and window and window_tokens + num_tokens > self.max_tokens:
+                if fresh:
+                    yield emit()
+                    chunk_id += 1
+                    fresh = 0
+                # Keep at most `overlap` sentences, and only as many as still fit.
+                keep = min(self.overlap, len(window) - 1)
+                while len(window) > keep or (window and window_tokens + num_tokens > self.max_tokens):
+                    window_tokens -= window.popleft()[3]
+
+            window.append((sentence_index, page_number, sentence, num_tokens))
+            window_tokens += num_tokens
+            sentence_index += 1
+            fresh += 1
+
+            if len(window) == self.window_size:
+                yield emit()
+                chunk_id += 1
+                fresh = 0
+                for _ in range(min(step, len(window))):
+                    window_tokens -= window.popleft()[3]
+
+        if fresh and window:
+            yield emit()
+
+
+class EmbeddingCache:
+    """On-disk embedding cache backed by a memory-mapped float32 matrix.
+
+    Entries are keyed by ``sha256(model_name + normalized text)`` and map to a
+    row of ``vectors.f32``. When the cache is full the least recently used row
+    is overwritten. The key -> row table is kept in ``index.json``, written
+    every ``flush_every`` puts and at exit; each row's key digest is also kept
+    in ``keys.u8``, so entries of an older ``index.json`` whose row has since
+    been reused are dropped on load instead of returning the wrong vector.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, dim: int, max_entries: int = 100_000,
+                 flush_every: int = 1024):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.dim = dim
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        self._dirty = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, "index.json")
+        self._vectors_path = os.path.join(cache_dir, "vectors.f32")
+        self._keys_path = os.path.join(cache_dir, "keys.u8")
+
+        # key -> row, ordered from least to most recently used
+        self._slots = OrderedDict()
+        meta = None
+        if all(os.path.exists(path) for path in (self._index_path, self._vectors_path, self._keys_path)):
+            with open(self._index_path) as f:
+                meta = json.load(f)
+            if meta.get('dim') != dim or meta.get('max_entries') != max_entries:
+                print("Embedding cache layout changed, starting a fresh cache")
+                meta = None
+
+        mode = 'w+' if meta is None else 'r+'
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=(max_entries, dim))
+        self._keys = np.memmap(self._keys_path, dtype=np.uint8, mode=mode, shape=(max_entries, 32))
+        if meta is not None:
+            for key, slot in meta['entries']:
+                if self._keys[slot].tobytes() == bytes.fromhex(key):
+                    self._slots[key] = slot
+
+        self._free = sorted(set(range(max_entries)) - set(self._slots.values()), reverse=True)
+        atexit.register(self.flush)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return re.sub(r"\s+", " ", text).strip()
+
+    def key(self, text: str) -> str:
+        payload = f"{self.model_name}\0{self.normalize(text)}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = self.key(text)
+        slot = self._slots.get(key)
+        if slot is None:
+            self.misses += 1
+            return None
+        self._slots.move_to_end(key)
+        self.hits += 1
+        return np.array(self._vectors[slot])
+
+    def put(self, text: str, embedding: np.ndarray):
+        key = self.key(text)
+        slot = self._slots.get(key)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                _, slot = self._slots.popitem(last=False)
+        self._slots[key] = slot
+        self._slots.move_to_end(key)
+        # Clear the row's key first so a half-written row never matches any key.
+        self._keys[slot] = 0
+        self._vectors[slot] = embedding
+        self._keys[slot] = np.frombuffer(bytes.fromhex(key), dtype=np.uint8)
+
+        self._dirty += 1
+        if self._dirty >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._dirty:
+            return
+        self._vectors.flush()
+        self._keys.flush()
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                'model_name': self.model_name,
+                'dim': self.dim,
+                'max_entries': self.max_entries,
+                'entries': list(self._slots.items())
+            }, f)
+        os.replace(tmp_path, self._index_path)
+        self._dirty = 0
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._slots),
+            'max_entries': self.max_entries
+        }
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+
+class TransformerEmbedder:
+    """Sentence embeddings from a Hugging Face encoder.
+
+    ``pooling`` is ``"cls"`` (the [CLS] hidden state) or ``"mean"`` (masked
+    mean over tokens), and ``normalize`` L2-normalizes the result. ``runtime``
+    selects plain PyTorch (``"torch"``), ``torch.compile`` (``"compile"``) or
+    ONNX Runtime on CPU through optimum (``"onnx"``). The embedding cache goes
+    in a subdirectory of ``cache_dir`` named after ``identity``, so backends
+    sharing a ``cache_dir`` never overwrite each other's entries.
+    """
+
+    def __init__(self, model_name: str = 'bert-base-uncased', pooling: str = "cls", normalize: bool = False,
+                 max_length: int = 512, runtime: str = "torch", cache_dir: Optional[str] = None,
+                 cache_size: int = 100_000):
+        if pooling not in ("cls", "mean"):
+            raise ValueError(f"Unknown pooling: {pooling}")
+        self.model_name = model_name
+        self.pooling = pooling
+        self.normalize = normalize
+        self.max_length = max_length
+        self.runtime = runtime
+        print(f"Loading embedding model: {model_name} ({pooling} pooling, {runtime})")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.device = torch.device('cuda' if torch.cuda.is_available() and runtime != "onnx" else 'cpu')
+
+        if runtime == "onnx":
+            try:
+                from optimum.onnxruntime import ORTModelForFeatureExtraction
+            except ImportError as e:
+                raise ImportError("runtime='onnx' requires optimum[onnxruntime]") from e
+            self.model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+            self.dim = self.model.config.hidden_size
+        elif runtime in ("torch", "compile"):
+            self.model = AutoModel.from_pretrained(model_name)
+            self.model.eval() 
+            self.model.to(self.device)
+            self.dim = self.model.config.hidden_size
+            if runtime == "compile":
+                self.model = torch.compile(self.model)
+        else:
+            raise ValueError(f"Unknown runtime: {runtime}")
         print(f"Using device: {self.device}")
+
+        self.cache = None
+        if cache_dir is not None:
+            cache_dir = os.path.join(cache_dir, hashlib.sha1(self.identity.encode("utf-8")).hexdigest()[:12])
+            self.cache = EmbeddingCache(cache_dir, self.identity, self.dim, max_entries=cache_size)
+
+    @property
+    def identity(self) -> str:
+        """Everything that changes the vectors; stored with caches and collections."""
+        return f"{self.model_name}|{self.pooling}|{'l2' if self.normalize else 'raw'}"
     
     def get_embedding(self, text: str) -> np.ndarray:
+        if self.cache is not None:
+            cached = self.cache.get(text)
+            if cached is not None:
+                return cached
+
+        embedding = self._embed_batch([text])[0]
+        if self.cache is not None:
+            self.cache.put(text, embedding)
+        return embedding
+    
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
         inputs = self.tokenizer(
-            text,
+            texts,
             return_tensors='pt',
             truncation=True,
-            max_length=512,
+            max_length=self.max_length,
             padding=True
         )
-        
-
         inputs = {k: v.to(self.device) for k, v in inputs.items()}
-        
 
         with torch.no_grad():
-            outputs = self.model(**inputs)
-        
-        cls_embedding = outputs.last_hidden_state[:, 0, :].cpu().numpy()
-        
-        return cls_embedding[0]
-    
-    def batch_embed(self, texts: List[str], batch_size: int = 8) -> List[np.ndarray]:
-        embeddings = []
-        
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            print(f"Processing batch {i//batch_size + 1}/{(len(texts)-1)//batch_size + 1}")
-            
-            for text in batch:
-                embedding = self.get_embedding(text)
-                embeddings.append(embedding)
-        
+            hidden = self.model(**inputs).last_hidden_state.float()
+
+            if self.pooling == "cls":
+                pooled = hidden[:, 0, :]
+            else:
+                mask = inputs['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+
+            if self.normalize:
+                pooled = torch.nn.functional.normalize(pooled, p=2, dim=1)
+
+        return pooled.cpu().numpy()
+
+    def batch_embed(self, texts: List[str], token_budget: int = 4096,
+                    max_batch_size: int = 64, verbose: bool = False) -> np.ndarray:
+        """Embed texts with one forward pass per padded batch.
+
+        Texts are sorted by token length so each batch pads to a similar size,
+        and a batch grows until ``batch_len * longest_seq`` would exceed
+        ``token_budget``. Rows come back in the original input order.
+        ``verbose`` prints cache hits and batch progress (used by ingestion).
+        """
+        with telemetry.span("embed", texts=len(texts)):
+            return self._batch_embed(texts, token_budget, max_batch_size, verbose)
+
+    def _batch_embed(self, texts: List[str], token_budget: int, max_batch_size: int,
+                     verbose: bool = False) -> np.ndarray:
+        embeddings = np.empty((len(texts), self.dim), dtype=np.float32)
+
+        pending = list(range(len(texts)))
+        if self.cache is not None:
+            pending = []
+            for idx, text in enumerate(texts):
+                cached = self.cache.get(text)
+                if cached is None:
+                    pending.append(idx)
+                else:
+                    embeddings[idx] = cached
+            if verbose:
+                print(f"Embedding cache: {len(texts) - len(pending)} hits, {len(pending)} misses")
+            telemetry.count("rag_embedding_cache_hits_total", len(texts) - len(pending))
+            telemetry.count("rag_embedding_cache_misses_total", len(pending))
+
+        if not pending:
+            return embeddings
+
+        self._embed_into(embeddings, texts, pending, token_budget, max_batch_size, verbose)
+
+        if self.cache is not None:
+            for idx in pending:
+                self.cache.put(texts[idx], embeddings[idx])
+            self.cache.flush()
+
         return embeddings
 
+    def _embed_into(self, embeddings: np.ndarray, texts: List[str], indices: List[int],
+                    token_budget: int, max_batch_size: int, verbose: bool = False):
+        lengths = [
+            min(len(ids), self.max_length)
+            for ids in self.tokenizer([texts[idx] for idx in indices], add_special_tokens=True,
+                                      truncation=False)['input_ids']
+        ]
+        lengths = dict(zip(indices, lengths))
+        order = sorted(indices, key=lambda idx: lengths[idx])
+
+        batches = []
+        current = []
+        for idx in order:
+            longest = lengths[idx]  # sorted ascending, so the newest item is the longest
+            if current and ((len(current) + 1) * longest > token_budget or len(current) >= max_batch_size):
+                batches.append(current)
+                current = []
+            current.append(idx)
+        if current:
+            batches.append(current)
+
+        for b, batch in enumerate(batches):
+            if verbose:
+                print(f"Processing batch {b + 1}/{len(batches)} ({len(batch)} texts)")
+            telemetry.observe("rag_embed_batch_size", len(batch))
+            telemetry.count("rag_embedded_texts_total", len(batch))
+            with telemetry.span("embed.batch", texts=len(batch), max_tokens=lengths[batch[-1]]):
+                embeddings[batch] = self._embed_batch([texts[idx] for idx in batch])
+
+
+class BERTEmbedder(TransformerEmbedder):
+    """The original bert-base-uncased [CLS] embedder."""
+
+    def __init__(self, model_name: str = 'bert-base-uncased', **kwargs):
+        super().__init__(model_name, pooling="cls", normalize=False, **kwargs)
+
+
+EMBEDDING_BACKENDS = {
+    'bert-cls': dict(model_name='bert-base-uncased', pooling="cls", normalize=False, max_length=512),
+    'minilm': dict(model_name='sentence-transformers/all-MiniLM-L6-v2', pooling="mean", normalize=True,
+                   max_length=256),
+}
+
+
+def make_embedder(backend: str = "bert-cls", **kwargs) -> TransformerEmbedder:
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    return TransformerEmbedder(**{**EMBEDDING_BACKENDS[backend], **kwargs})
+
+
+class VectorStore(ABC):
+    """Interface shared by the vector store backends used by ``RAGSystem``.
+
+    ``search`` returns Chroma's result layout (``ids``, ``documents``,
+    ``metadatas`` and cosine ``distances``, one list per query) whichever
+    backend is in use.
+    """
+
+    @staticmethod
+    def source_key(file_path: str) -> str:
+        return hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:12]
+
+    @staticmethod
+    def assign_chunk_ids(chunks: List[Dict], source: str, seen: Optional[Dict[str, int]] = None):
+        """Give each chunk a stable ``<source_key>_<content hash>_<n>`` id.
+
+        The id depends only on the source path and the chunk text, so an
+        unchanged chunk keeps its id even when earlier pages are edited.
+        ``n`` disambiguates identical chunks within one source; pass the same
+        ``seen`` dict across calls when ids are assigned batch by batch.
+        """
+        prefix = VectorStore.source_key(source)
+        seen = {} if seen is None else seen
+        for chunk in chunks:
+            digest = hashlib.sha256(chunk['text'].encode("utf-8")).hexdigest()[:24]
+            n = seen.get(digest, 0)
+            seen[digest] = n + 1
+            chunk['id'] = f"{prefix}_{digest}_{n}"
+            chunk['source'] = source
 
-class ChromaVectorStore:
-    def __init__(self, collection_name: str = "postgres_docs", persist_directory: str = "./chroma_db"):
+    @staticmethod
+    def _metadata(chunk: Dict) -> Dict:
+        metadata = {
+            'source': chunk.get('source', ''),
+            'start_sentence': chunk['start_sentence'],
+            'end_sentence': chunk['end_sentence'],
+            'num_sentences': chunk['num_sentences']
+        }
+        if 'page_start' in chunk:
+            metadata['page_start'] = chunk['page_start']
+            metadata['page_end'] = chunk['page_end']
+        return metadata
+
+    @staticmethod
+    def diff_chunks(chunks: List[Dict], existing: Dict[str, Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """Split id-tagged ``chunks`` into ``(new_chunks, moved_chunks)``.
+
+        ``existing`` is the ``get_source_metadata`` result for the source:
+        chunks not in it need embedding, chunks whose stored position metadata
+        differs only need a metadata update.
+        """
+        new_chunks = []
+        moved_chunks = []
+        for chunk in chunks:
+            stored = existing.get(chunk['id'])
+            if stored is None:
+                new_chunks.append(chunk)
+            elif stored != VectorStore._metadata(chunk):
+                moved_chunks.append(chunk)
+        return new_chunks, moved_chunks
+
+    @staticmethod
+    def check_embedding_metadata(stored: Dict, dim: Optional[int], embedding_model: Optional[str], where: str):
+        """Refuse to mix vectors from different embedders in one collection."""
+        stored_dim = stored.get('embedding_dim', stored.get('dim'))
+        if dim is not None and stored_dim is not None and stored_dim != dim:
+            raise ValueError(f"{where} holds {stored_dim}-dim vectors, embedder produces {dim}")
+        stored_model = stored.get('embedding_model')
+        if embedding_model is not None and stored_model is not None and stored_model != embedding_model:
+            raise ValueError(f"{where} was built with {stored_model}, not {embedding_model}")
+
+    @abstractmethod
+    def add_documents(self, chunks: List[Dict], embeddings: List[np.ndarray]):
+        ...
+
+    @abstractmethod
+    def get_source_metadata(self, source: str) -> Dict[str, Dict]:
+        ...
+
+    def source_count(self, source: str) -> int:
+        """Number of chunks stored for ``source``."""
+        return len(self.get_source_metadata(source))
+
+    @abstractmethod
+    def update_metadata(self, chunks: List[Dict]):
+        ...
+
+    @abstractmethod
+    def delete_ids(self, ids: List[str]):
+        ...
+
+    @abstractmethod
+    def get_by_ids(self, ids: List[str]) -> Dict[str, Dict]:
+        """``{id: {'text', 'metadata'}}`` for the stored ids among ``ids``."""
+
+    @abstractmethod
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[Tuple[str, str]]:
+        """Yield ``(id, text)`` for every stored chunk."""
+
+    def search(self, query_embedding: np.ndarray, n_results: int = 5) -> Dict:
+        return self.search_batch(np.asarray(query_embedding).reshape(1, -1), n_results=n_results)
+
+    @abstractmethod
+    def search_batch(self, query_embeddings: np.ndarray, n_results: int = 5) -> Dict:
+        """Search several queries at once; result lists are indexed by query."""
+
+    def persist(self):
+        """Flush anything held in memory to disk. A no-op for self-persisting backends."""
+
+
+class ChromaVectorStore(VectorStore):
+    def __init__(self, collection_name: str = "postgres_docs", persist_directory: str = "./chroma_db",
+                 dim: Optional[int] = None, embedding_model: Optional[str] = None, persistent: bool = True):
         self.persist_directory = persist_directory
         
-        self.client = chromadb.Client(Settings(
-            persist_directory=persist_directory,
-            anonymized_telemetry=False
-        ))
-        
-        self.collection = self.client.get_or_create_collection(
-            name=collection_name,
-            metadata={"hnsw:space": "cosine"} 
-        )
+        # chromadb >= 0.4 ignores persist_directory in Client(Settings(...)) and
+        # keeps everything in memory; PersistentClient writes to disk as it goes.
+        settings = Settings(anonymized_telemetry=False)
+        if persistent:
+            self.client = chromadb.PersistentClient(path=persist_directory, settings=settings)
+        else:
+            self.client = chromadb.EphemeralClient(settings=settings)
         
-        print(f"Vector store initialized with collection: {collection_name}")
+        metadata = {"hnsw:space": "cosine"}
+        if dim is not None:
+            metadata['embedding_dim'] = dim
+        if embedding_model is not None:
+            metadata['embedding_model'] = embedding_model
+
+        if collection_name in {c.name for c in self.client.list_collections()}:
+            self.collection = self.client.get_collection(name=collection_name)
+            self.check_embedding_metadata(self.collection.metadata or {}, dim, embedding_model, collection_name)
+            print(f"Reopened collection {collection_name} with {self.collection.count()} chunks")
+        else:
+            self.collection = self.client.create_collection(name=collection_name, metadata=metadata)
+            print(f"Vector store initialized with collection: {collection_name}")
     
     def add_documents(self, chunks: List[Dict], embeddings: List[np.ndarray]):
      
-        ids = [f"chunk_{chunk['chunk_id']}" for chunk in chunks]
+        ids = [chunk.get('id', f"chunk_{chunk['chunk_id']}") for chunk in chunks]
         documents = [chunk['text'] for chunk in chunks]
-        metadatas = [
-            {
-                'start_sentence': chunk['start_sentence'],
-                'end_sentence': chunk['end_sentence'],
-                'num_sentences': chunk['num_sentences']
-            }
-            for chunk in chunks
-        ]
+        metadatas = [self._metadata(chunk) for chunk in chunks]
         
         embeddings_list = [emb.tolist() for emb in embeddings]
         
-        self.collection.add(
+        self.collection.upsert(
             ids=ids,
             documents=documents,
             embeddings=embeddings_list,
@@ -164,25 +957,919 @@ class ChromaVectorStore:
         )
         
         print(f"Added {len(chunks)} chunks to vector store")
-    
-    def search(self, query_embedding: np.ndarray, n_results: int = 5) -> Dict:
+
+    def get_source_metadata(self, source: str) -> Dict[str, Dict]:
+        existing = self.collection.get(where={'source': source}, include=['metadatas'])
+        return dict(zip(existing['ids'], existing['metadatas']))
+
+    def source_count(self, source: str) -> int:
+        return len(self.collection.get(where={'source': source}, include=[])['ids'])
+
+    def update_metadata(self, chunks: List[Dict]):
+        if chunks:
+            self.collection.update(
+                ids=[chunk['id'] for chunk in chunks],
+                metadatas=[self._metadata(chunk) for chunk in chunks]
+            )
+
+    def delete_ids(self, ids: List[str]):
+        if ids:
+            self.collection.delete(ids=ids)
+            print(f"Deleted {len(ids)} stale chunks from vector store")
+
+    def get_by_ids(self, ids: List[str]) -> Dict[str, Dict]:
+        if not ids:
+            return {}
+        found = self.collection.get(ids=ids, include=['documents', 'metadatas'])
+        return {
+            chunk_id: {'text': doc, 'metadata': metadata}
+            for chunk_id, doc, metadata in zip(found['ids'], found['documents'], found['metadatas'])
+        }
+
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[Tuple[str, str]]:
+        offset = 0
+        while True:
+            page = self.collection.get(include=['documents'], limit=batch_size, offset=offset)
+            if not page['ids']:
+                return
+            yield from zip(page['ids'], page['documents'])
+            offset += len(page['ids'])
+
+    def search_batch(self, query_embeddings: np.ndarray, n_results: int = 5) -> Dict:
         results = self.collection.query(
-            query_embeddings=[query_embedding.tolist()],
+            query_embeddings=np.asarray(query_embeddings).tolist(),
             n_results=n_results
         )
         
         return results
 
 
+class _VectorFile:
+    """Append-only float32 row matrix behind ``FaissVectorStore``.
+
+    The first ``stored`` rows live in the raw file at ``path`` and are
+    memory-mapped; rows appended since are kept in a RAM buffer whose
+    capacity doubles, so an append costs O(batch) and never pulls the
+    persisted rows back into memory. ``flush`` appends the buffer to a file.
+    """
+
+    def __init__(self, dim: int, path: Optional[str] = None, stored: int = 0):
+        self.dim = dim
+        self.path = path
+        self.stored = stored
+        self._mapped = self._map()
+        self._buffer = np.zeros((0, dim), dtype=np.float32)
+        self._buffered = 0
+
+    def _map(self) -> np.ndarray:
+        if not self.stored:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.memmap(self.path, dtype=np.float32, mode='r', shape=(self.stored, self.dim))
+
+    def __len__(self) -> int:
+        return self.stored + self._buffered
+
+    def append(self, rows: np.ndarray):
+        n = len(rows)
+        if self._buffered + n > len(self._buffer):
+            grown = np.empty((max(2 * len(self._buffer), self._buffered + n, 1024), self.dim), dtype=np.float32)
+            grown[:self._buffered] = self._buffer[:self._buffered]
+            self._buffer = grown
+        self._buffer[self._buffered:self._buffered + n] = rows
+        self._buffered += n
+
+    def slice(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Rows ``[start, stop)`` as one contiguous array."""
+        stop = len(self) if stop is None else stop
+        parts = []
+        if start < self.stored:
+            parts.append(self._mapped[start:min(stop, self.stored)])
+        if stop > self.stored:
+            parts.append(self._buffer[max(start - self.stored, 0):stop - self.stored])
+        if len(parts) == 1:
+            return np.ascontiguousarray(parts[0])
+        return np.concatenate(parts) if parts else np.zeros((0, self.dim), dtype=np.float32)
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        rows = np.asarray(rows)
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        mapped = rows < self.stored
+        out[mapped] = self._mapped[rows[mapped]]
+        out[~mapped] = self._buffer[rows[~mapped] - self.stored]
+        return out
+
+    def flush(self, path: str):
+        """Append the buffered rows to ``path`` (a new file unless it is ``self.path``) and map them."""
+        if path != self.path and self.stored:
+            raise ValueError("Only a matrix without stored rows can move to a new file")
+        with open(path, "r+b" if self.stored else "wb") as f:
+            # Anything past the stored rows is left over from an interrupted flush.
+            f.seek(self.stored * self.dim * 4)
+            f.write(self._buffer[:self._buffered].tobytes())
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+        self.path = path
+        self.stored += self._buffered
+        self._mapped = self._map()
+        self._buffer = np.zeros((0, self.dim), dtype=np.float32)
+        self._buffered = 0
+
+
+class FaissVectorStore(VectorStore):
+    """In-process vector store on top of a faiss index.
+
+    Vectors are L2-normalized and searched by inner product, so scores are
+    cosine similarities. ``index_type`` is ``"flat"`` (exact), ``"ivf"`` or
+    ``"hnsw"``. Row ``i`` of the vector matrix is label ``i`` in the index;
+    deletes and overwrites leave tombstones that searches skip with an ID
+    selector and that are compacted away once they exceed ``compact_ratio``
+    of the rows. ``persist()`` appends new vectors to a raw float32 file in
+    ``persist_directory`` and a later instance memory-maps it back.
+
+    ``quantization`` compresses the vectors held by the index: ``"fp16"``
+    (2x), ``"int8"`` scalar quantization (4x) or ``"pq"`` product
+    quantization with ``pq_m`` one-byte sub-codes (``4 * dim / pq_m``x).
+    The top ``n_results * rerank_factor`` candidates are then re-scored
+    against the full-precision vectors, which after ``persist()`` are read
+    from a memory-mapped file rather than held in RAM.
+    """
+
+    QUANTIZATION_CODECS = {None: "Flat", "fp16": "SQfp16", "int8": "SQ8", "pq": "PQ{pq_m}"}
+
+    def __init__(self, dim: int, index_type: str = "hnsw", persist_directory: Optional[str] = "./faiss_db",
+                 nlist: int = 1024, nprobe: int = 16, hnsw_m: int = 32, ef_search: int = 64,
+                 compact_ratio: float = 0.2, quantization: Optional[str] = None, pq_m: int = 96,
+                 rerank_factor: int = 4, embedding_model: Optional[str] = None):
+        try:
+            import faiss
+        except ImportError as e:
+            raise ImportError("FaissVectorStore requires faiss (pip install faiss-cpu)") from e
+        if index_type not in ("flat", "ivf", "hnsw"):
+            raise ValueError(f"Unknown index_type: {index_type}")
+        if quantization not in self.QUANTIZATION_CODECS:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        if quantization == "pq" and dim % pq_m:
+            raise ValueError(f"pq_m={pq_m} must divide dim={dim}")
+
+        self.faiss = faiss
+        self.dim = dim
+        self.embedding_model = embedding_model
+        self.index_type = index_type
+        self.persist_directory = persist_directory
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.compact_ratio = compact_ratio
+        self.quantization = quantization
+        self.pq_m = pq_m
+        self.rerank_factor = rerank_factor if quantization else 1
+
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict] = []
+        self.rows: Dict[str, int] = {}
+        self.sources: Dict[str, set] = {}  # source -> ids of its live chunks
+        self.deleted = set()
+        self.vectors = _VectorFile(dim)
+        self.index = None
+        self._indexed = 0  # rows [0, _indexed) are in self.index
+        self._index_mmapped = False  # read-only until reloaded by _ensure_writable_index
+        self._dirty = False  # ids/documents/metadata changed since the last persist
+        self._vectors_dirty = False  # vectors or index changed since the last persist
+        self._selector = None  # excludes self.deleted from index searches; rebuilt after deletes
+        self._selector_rows = None  # keeps the selector's row array alive
+        self._replaced_vectors_path = None  # persisted vectors file a compaction has superseded
+
+        if persist_directory and os.path.exists(os.path.join(persist_directory, "store.json")):
+            self._load()
+        else:
+            self.index = self._new_index()
+
+        print(f"Faiss vector store initialized ({self.factory_string()}, {self.count()} vectors)")
+
+    def factory_string(self) -> str:
+        codec = self.QUANTIZATION_CODECS[self.quantization].format(pq_m=self.pq_m)
+        if self.index_type == "ivf":
+            return f"IVF{self.nlist},{codec}"
+        if self.index_type == "hnsw":
+            return f"HNSW{self.hnsw_m}" if codec == "Flat" else f"HNSW{self.hnsw_m}_{codec}"
+        return codec
+
+    def _new_index(self):
+        index = self.faiss.index_factory(self.dim, self.factory_string(), self.faiss.METRIC_INNER_PRODUCT)
+        self._set_search_params(index)
+        return index
+
+    def _set_search_params(self, index):
+        if self.index_type == "hnsw":
+            self.faiss.downcast_index(index).hnsw.efSearch = self.ef_search
+        elif self.index_type == "ivf":
+            self.faiss.extract_index_ivf(index).nprobe = self.nprobe
+
+    def _min_training_vectors(self) -> int:
+        # Roughly faiss' own recommendation of ~39 points per centroid.
+        minimum = 1
+        if self.index_type == "ivf":
+            minimum = max(minimum, self.nlist * 39)
+        if self.quantization == "pq":
+            minimum = max(minimum, 256 * 39)
+        return minimum
+
+    def memory_bytes(self) -> int:
+        """Size of the serialized index, i.e. what search keeps in RAM."""
+        return int(self.faiss.serialize_index(self.index).nbytes)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _ensure_writable_index(self):
+        # A memory-mapped index is read-only (IVF lists become OnDiskInvertedLists);
+        # read it fully into RAM before the first write.
+        if self._index_mmapped:
+            self.index = self.faiss.read_index(os.path.join(self.persist_directory, "index.faiss"))
+            self._set_search_params(self.index)
+            self._index_mmapped = False
+
+    def _sync_index(self):
+        # IVF/SQ/PQ need training data; until there is enough, search falls back to brute force.
+        if self._indexed == len(self.vectors) and self.index.is_trained:
+            return
+        self._ensure_writable_index()
+        if not self.index.is_trained:
+            if len(self.vectors) < self._min_training_vectors():
+                return
+            self.index.train(self.vectors.slice())
+        if self._indexed < len(self.vectors):
+            self.index.add(self.vectors.slice(self._indexed))
+            self._indexed = len(self.vectors)
+
+    def count(self) -> int:
+        return len(self.ids) - len(self.deleted)
+
+    def add_documents(self, chunks: List[Dict], embeddings: List[np.ndarray]):
+        for chunk in chunks:
+            old_row = self.rows.get(chunk['id'])
+            if old_row is not None:
+                self.deleted.add(old_row)
+                self._selector = None
+                self._unlink_source(chunk['id'], old_row)
+
+        start = len(self.ids)
+        for offset, chunk in enumerate(chunks):
+            self.rows[chunk['id']] = start + offset
+            self.ids.append(chunk['id'])
+            self.documents.append(chunk['text'])
+            self.metadatas.append(self._metadata(chunk))
+            self.sources.setdefault(self.metadatas[-1]['source'], set()).add(chunk['id'])
+
+        self.vectors.append(self._normalize(np.asarray(embeddings)))
+        self._dirty = self._vectors_dirty = True
+        self._sync_index()
+        self._maybe_compact()
+        print(f"Added {len(chunks)} chunks to vector store")
+
+    def _unlink_source(self, chunk_id: str, row: int):
+        source = self.metadatas[row]['source']
+        self.sources[source].discard(chunk_id)
+        if not self.sources[source]:
+            del self.sources[source]
+
+    def get_source_metadata(self, source: str) -> Dict[str, Dict]:
+        return {chunk_id: self.metadatas[self.rows[chunk_id]] for chunk_id in self.sources.get(source, ())}
+
+    def source_count(self, source: str) -> int:
+        return len(self.sources.get(source, ()))
+
+    def update_metadata(self, chunks: List[Dict]):
+        for chunk in chunks:
+            row = self.rows.get(chunk['id'])
+            if row is not None:
+                self._unlink_source(chunk['id'], row)
+                self.metadatas[row] = self._metadata(chunk)
+                self.sources.setdefault(self.metadatas[row]['source'], set()).add(chunk['id'])
+                self._dirty = True
+
+    def delete_ids(self, ids: List[str]):
+        removed = 0
+        for chunk_id in ids:
+            row = self.rows.pop(chunk_id, None)
+            if row is not None:
+                self.deleted.add(row)
+                self._unlink_source(chunk_id, row)
+                removed += 1
+        if removed:
+            self._dirty = True
+            self._selector = None
+            print(f"Deleted {removed} stale chunks from vector store")
+            self._maybe_compact()
+
+    def get_by_ids(self, ids: List[str]) -> Dict[str, Dict]:
+        return {
+            chunk_id: {'text': self.documents[self.rows[chunk_id]], 'metadata': self.metadatas[self.rows[chunk_id]]}
+            for chunk_id in ids if chunk_id in self.rows
+        }
+
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[Tuple[str, str]]:
+        for chunk_id, row in list(self.rows.items()):
+            yield chunk_id, self.documents[row]
+
+    def _maybe_compact(self):
+        if not self.deleted or len(self.deleted) < self.compact_ratio * len(self.ids):
+            return
+        keep = [row for row in range(len(self.ids)) if row not in self.deleted]
+        self.ids = [self.ids[row] for row in keep]
+        self.documents = [self.documents[row] for row in keep]
+        self.metadatas = [self.metadatas[row] for row in keep]
+        vectors = _VectorFile(self.dim)  # persist() writes it to a new file
+        vectors.append(self.vectors.take(np.asarray(keep, dtype=np.int64)))
+        if self.vectors.path is not None:
+            self._replaced_vectors_path = self.vectors.path
+        self.vectors = vectors
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self.deleted = set()
+        self._selector = None
+        self.index = self._new_index()
+        self._index_mmapped = False
+        self._indexed = 0
+        self._dirty = self._vectors_dirty = True
+        self._sync_index()
+
+    def _search_params(self):
+        """faiss search parameters that skip deleted rows, or None if nothing is deleted."""
+        if not self.deleted:
+            return None
+        if self._selector is None:
+            self._selector_rows = np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted))
+            self._selector = self.faiss.IDSelectorNot(
+                self.faiss.IDSelectorBatch(len(self._selector_rows), self.faiss.swig_ptr(self._selector_rows)))
+        # Passing params replaces the index's own settings, so repeat them here.
+        if self.index_type == "hnsw":
+            return self.faiss.SearchParametersHNSW(sel=self._selector, efSearch=self.ef_search)
+        if self.index_type == "ivf":
+            return self.faiss.SearchParametersIVF(sel=self._selector, nprobe=self.nprobe)
+        return self.faiss.SearchParameters(sel=self._selector)
+
+    def _search_index(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        params = self._search_params()
+        if params is None:
+            return self.index.search(queries, k)
+        try:
+            return self.index.search(queries, k, params=params)
+        except RuntimeError:
+            pass  # index type without selector support (flat PQ)
+        # Oversample by a growing but bounded factor until every query has k live rows.
+        fetch = min(2 * k, self.index.ntotal)
+        while True:
+            scores, rows = self.index.search(queries, fetch)
+            live = np.isin(rows, self._selector_rows, invert=True) & (rows >= 0)
+            if live.sum(axis=1).min() >= k or fetch >= self.index.ntotal:
+                break
+            fetch = min(4 * fetch, self.index.ntotal)
+        order = np.argsort(~live, axis=1, kind='stable')[:, :k]
+        scores, rows = np.take_along_axis(scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
+        return scores, np.where(np.take_along_axis(live, order, axis=1), rows, -1)
+
+    def _search_rows(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self._indexed == len(self.vectors) and self._indexed > 0:
+            return self._search_index(queries, k)
+        # Index not trained yet (too few vectors for IVF/SQ/PQ): exact search in numpy.
+        scores = queries @ self.vectors.slice().T
+        if self.deleted:
+            scores[:, list(self.deleted)] = -np.inf
+        k = min(k, scores.shape[1])
+        top = np.argsort(-scores, axis=1)[:, :k]
+        return np.take_along_axis(scores, top, axis=1), top
+
+    def _rerank(self, queries: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Re-score the quantized candidates with the exact vectors and re-sort.
+        safe_rows = np.where(rows < 0, 0, rows)
+        exact = np.einsum('qd,qkd->qk', queries, self.vectors.take(safe_rows.ravel())
+                          .reshape(rows.shape[0], rows.shape[1], self.dim))
+        exact = np.where(rows < 0, -np.inf, exact)
+        order = np.argsort(-exact, axis=1)
+        return np.take_along_axis(exact, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+    def search_batch(self, query_embeddings: np.ndarray, n_results: int = 5) -> Dict:
+        queries = self._normalize(np.asarray(query_embeddings).reshape(-1, self.dim))
+        results = {key: [[] for _ in range(len(queries))]
+                   for key in ('ids', 'documents', 'metadatas', 'distances')}
+        if self.count() == 0:
+            return results
+
+        k = min(n_results * self.rerank_factor, len(self.ids))
+        scores, rows = self._search_rows(queries, k)
+        if self.rerank_factor > 1:
+            scores, rows = self._rerank(queries, rows)
+
+        for q in range(len(queries)):
+            for score, row in zip(scores[q], rows[q]):
+                if row < 0 or row in self.deleted:
+                    continue
+                results['ids'][q].append(self.ids[row])
+                results['documents'][q].append(self.documents[row])
+                results['metadatas'][q].append(self.metadatas[row])
+                results['distances'][q].append(1.0 - float(score))
+                if len(results['ids'][q]) == n_results:
+                    break
+        return results
+
+    def persist(self):
+        """Write changes to ``persist_directory``; a no-op when nothing changed.
+
+        New vectors are appended to the current vectors file (after a
+        compaction, to a new one); the index and ``store.json`` are written to
+        temporary names and renamed into place. ``store.json`` goes last and
+        records how many rows are valid, so a crash leaves the previous
+        version readable.
+        """
+        if not self.persist_directory:
+            return
+        self._maybe_compact()
+        if not (self._dirty or self._vectors_dirty):
+            return
+        os.makedirs(self.persist_directory, exist_ok=True)
+
+        if self._vectors_dirty:
+            vectors_path = self.vectors.path
+            if vectors_path is None:
+                vectors_path = os.path.join(self.persist_directory, f"vectors-{time.time_ns()}.f32")
+            # Keep only the compressed index in RAM; full vectors are paged in for re-ranking.
+            self.vectors.flush(vectors_path)
+            index_path = os.path.join(self.persist_directory, "index.faiss")
+            self.faiss.write_index(self.index, index_path + ".tmp")
+            os.replace(index_path + ".tmp", index_path)
+
+        store_path = os.path.join(self.persist_directory, "store.json")
+        with open(store_path + ".tmp", "w") as f:
+            json.dump({
+                'dim': self.dim,
+                'embedding_model': self.embedding_model,
+                'index_type': self.index_type,
+                'factory': self.factory_string(),
+                'indexed': self._indexed,
+                'vectors_file': os.path.basename(self.vectors.path),
+                'ids': self.ids,
+                'documents': self.documents,
+                'metadatas': self.metadatas,
+                'deleted': sorted(self.deleted)
+            }, f)
+        os.replace(store_path + ".tmp", store_path)
+        self._dirty = self._vectors_dirty = False
+        if self._replaced_vectors_path is not None:
+            os.remove(self._replaced_vectors_path)
+            self._replaced_vectors_path = None
+
+    def _load(self):
+        with open(os.path.join(self.persist_directory, "store.json")) as f:
+            state = json.load(f)
+        factory = state.get('factory', self.factory_string())
+        if state['dim'] != self.dim or factory != self.factory_string():
+            raise ValueError(
+                f"{self.persist_directory} holds a {factory} index of dim {state['dim']}, "
+                f"expected {self.factory_string()} of dim {self.dim}"
+            )
+        self.check_embedding_metadata(state, self.dim, self.embedding_model, self.persist_directory)
+        self.ids = state['ids']
+        self.documents = state['documents']
+        self.metadatas = state['metadatas']
+        self.deleted = set(state['deleted'])
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(self.ids) if row not in self.deleted}
+        for chunk_id, row in self.rows.items():
+            self.sources.setdefault(self.metadatas[row]['source'], set()).add(chunk_id)
+        self.vectors = _VectorFile(self.dim, os.path.join(self.persist_directory, state['vectors_file']),
+                                   stored=len(self.ids))
+        self.index = self.faiss.read_index(os.path.join(self.persist_directory, "index.faiss"),
+                                           self.faiss.IO_FLAG_MMAP)
+        self._index_mmapped = True
+        self._indexed = state['indexed']
+        self._set_search_params(self.index)
+        if self.index.ntotal != self._indexed:
+            # The index was replaced but store.json was not (interrupted persist): rebuild it.
+            self.index = self._new_index()
+            self._index_mmapped = False
+            self._indexed = 0
+            self._sync_index()
+            self._vectors_dirty = True
+
+
+def make_vector_store(backend: str = "chroma", dim: int = 768, embedding_model: Optional[str] = None,
+                      **kwargs) -> VectorStore:
+    if backend == "chroma":
+        return ChromaVectorStore(dim=dim, embedding_model=embedding_model, **kwargs)
+    if backend == "faiss":
+        return FaissVectorStore(dim=dim, embedding_model=embedding_model, **kwargs)
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+class BM25Index:
+    """In-process BM25 inverted index over chunk texts.
+
+    Postings are two parallel ``array('i')`` per term (document number and
+    term frequency), so they cost 8 bytes per posting and are scored with
+    numpy views instead of Python loops. Tokens keep identifiers such as
+    ``pg_stat_activity`` or ``max_wal_size`` whole and also index their parts.
+    Removed chunks are tombstoned and compacted away once they exceed
+    ``compact_ratio`` of the documents. ``persist()`` stores the index as
+    CSR-style arrays in ``persist_path``, with terms and ids as UTF-8 blobs
+    plus offsets, so it loads without pickle.
+    """
+
+    TOKEN_RE = re.compile(r"[a-z0-9_][a-z0-9_.]*[a-z0-9_]|[a-z0-9_]")
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, persist_path: Optional[str] = None,
+                 compact_ratio: float = 0.2):
+        self.k1 = k1
+        self.b = b
+        # np.savez always writes a .npz file
+        if persist_path and not persist_path.endswith(".npz"):
+            persist_path += ".npz"
+        self.persist_path = persist_path
+        self.compact_ratio = compact_ratio
+        self._reset()
+        if persist_path and os.path.exists(persist_path):
+            self._load()
+
+    def _reset(self):
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.doc_lengths = array('i')
+        self.postings_docs: Dict[str, array] = {}
+        self.postings_tfs: Dict[str, array] = {}
+        self.deleted = set()
+        self.total_length = 0
+
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        tokens = []
+        for token in cls.TOKEN_RE.findall(text.lower()):
+            tokens.append(token)
+            if "." in token:
+                tokens.extend(part for part in token.split(".") if part and "_" in part)
+            if "_" in token or "." in token:
+                tokens.extend(part for part in re.split(r"[_.]", token) if part)
+        return tokens
+
+    def __len__(self) -> int:
+        return len(self.ids) - len(self.deleted)
+
+    def add(self, chunks: List[Dict]):
+        for chunk in chunks:
+            old_row = self.rows.get(chunk['id'])
+            if old_row is not None:
+                self.deleted.add(old_row)
+                self.total_length -= self.doc_lengths[old_row]
+            row = len(self.ids)
+            self.ids.append(chunk['id'])
+            self.rows[chunk['id']] = row
+
+            counts = {}
+            for token in self.tokenize(chunk['text']):
+                counts[token] = counts.get(token, 0) + 1
+            length = sum(counts.values())
+            self.doc_lengths.append(length)
+            self.total_length += length
+            for token, tf in counts.items():
+                if token not in self.postings_docs:
+                    self.postings_docs[token] = array('i')
+                    self.postings_tfs[token] = array('i')
+                self.postings_docs[token].append(row)
+                self.postings_tfs[token].append(tf)
+        self._maybe_compact()
+
+    def remove(self, ids: List[str]):
+        for chunk_id in ids:
+            row = self.rows.pop(chunk_id, None)
+            if row is not None:
+                self.deleted.add(row)
+                self.total_length -= self.doc_lengths[row]
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        if not self.deleted or len(self.deleted) < self.compact_ratio * len(self.ids):
+            return
+        keep = np.array([row for row in range(len(self.ids)) if row not in self.deleted], dtype=np.int32)
+        remap = np.full(len(self.ids), -1, dtype=np.int32)
+        remap[keep] = np.arange(len(keep), dtype=np.int32)
+
+        lengths = np.frombuffer(self.doc_lengths, dtype=np.int32)
+        self.ids = [self.ids[row] for row in keep]
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self.doc_lengths = array('i', lengths[keep].tobytes())
+        for token in list(self.postings_docs):
+            docs = remap[np.frombuffer(self.postings_docs[token], dtype=np.int32)]
+            tfs = np.frombuffer(self.postings_tfs[token], dtype=np.int32)
+            alive = docs >= 0
+            if not alive.any():
+                del self.postings_docs[token], self.postings_tfs[token]
+                continue
+            self.postings_docs[token] = array('i', docs[alive].tobytes())
+            self.postings_tfs[token] = array('i', tfs[alive].tobytes())
+        self.deleted = set()
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top ``k`` ``(chunk_id, bm25_score)`` pairs for ``query``."""
+        num_docs = len(self)
+        if num_docs == 0:
+            return []
+        avg_length = self.total_length / num_docs
+        lengths = np.frombuffer(self.doc_lengths, dtype=np.int32)
+
+        all_docs = []
+        all_scores = []
+        for token in set(self.tokenize(query)):
+            docs_buffer = self.postings_docs.get(token)
+            if docs_buffer is None:
+                continue
+            docs = np.frombuffer(docs_buffer, dtype=np.int32)
+            tfs = np.frombuffer(self.postings_tfs[token], dtype=np.int32).astype(np.float32)
+            idf = np.log(1 + (num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths[docs] / avg_length)
+            all_docs.append(docs)
+            all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+        if not all_docs:
+            return []
+
+        docs, inverse = np.unique(np.concatenate(all_docs), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        if self.deleted:
+            scores[np.isin(docs, list(self.deleted))] = -np.inf
+        top = heapq.nlargest(k, range(len(docs)), key=scores.__getitem__)
+        return [(self.ids[docs[i]], float(scores[i])) for i in top if scores[i] > -np.inf]
+
+    @staticmethod
+    def _pack_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """``(utf8_blob, offsets)``: string ``i`` is ``blob[offsets[i]:offsets[i + 1]]``."""
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(data) for data in encoded])
+        return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+    @staticmethod
+    def _unpack_strings(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+        data = blob.tobytes()
+        return [data[start:stop].decode("utf-8") for start, stop in zip(offsets[:-1], offsets[1:])]
+
+    def persist(self):
+        if not self.persist_path:
+            return
+        self._maybe_compact()
+        terms = list(self.postings_docs)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(self.postings_docs[term]) for term in terms])
+        empty = np.zeros(0, dtype=np.int32)
+        terms_blob, terms_offsets = self._pack_strings(terms)
+        ids_blob, ids_offsets = self._pack_strings(self.ids)
+        np.savez(
+            self.persist_path,
+            terms_blob=terms_blob,
+            terms_offsets=terms_offsets,
+            offsets=offsets,
+            docs=np.concatenate([np.frombuffer(self.postings_docs[t], dtype=np.int32) for t in terms] or [empty]),
+            tfs=np.concatenate([np.frombuffer(self.postings_tfs[t], dtype=np.int32) for t in terms] or [empty]),
+            ids_blob=ids_blob,
+            ids_offsets=ids_offsets,
+            doc_lengths=np.frombuffer(self.doc_lengths, dtype=np.int32),
+            deleted=np.array(sorted(self.deleted), dtype=np.int32)
+        )
+
+    def _load(self):
+        state = np.load(self.persist_path)
+        if 'ids_blob' not in state.files:
+            # Written by an older version with pickled object arrays; RAGSystem rebuilds an empty index.
+            print(f"{self.persist_path} uses an old format, rebuilding the lexical index")
+            return
+        self.ids = self._unpack_strings(state['ids_blob'], state['ids_offsets'])
+        self.deleted = set(int(row) for row in state['deleted'])
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(self.ids) if row not in self.deleted}
+        self.doc_lengths = array('i', state['doc_lengths'].astype(np.int32).tobytes())
+        lengths = np.frombuffer(self.doc_lengths, dtype=np.int32)
+        self.total_length = int(lengths.sum()) - sum(int(lengths[row]) for row in self.deleted)
+        offsets, docs, tfs = state['offsets'], state['docs'], state['tfs']
+        for i, term in enumerate(self._unpack_strings(state['terms_blob'], state['terms_offsets'])):
+            self.postings_docs[term] = array('i', docs[offsets[i]:offsets[i + 1]].tobytes())
+            self.postings_tfs[term] = array('i', tfs[offsets[i]:offsets[i + 1]].tobytes())
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists: each id scores ``sum(1 / (k + rank))`` over the lists."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def _join_overlapping(left: str, right: str) -> str:
+    """Join two window texts, dropping the text ``right`` repeats from ``left``'s tail.
+
+    The overlap is the longest suffix of ``left`` that is a prefix of
+    ``right``, found in linear time with the KMP prefix function.
+    """
+    combined = right + "\0" + left
+    prefix = [0] * len(combined)
+    for i in range(1, len(combined)):
+        k = prefix[i - 1]
+        while k and combined[i] != combined[k]:
+            k = prefix[k - 1]
+        if combined[i] == combined[k]:
+            k += 1
+        prefix[i] = k
+    overlap = prefix[-1]
+    if overlap == 0:
+        return left + " " + right
+    return left + right[overlap:]
+
+
+def merge_contexts(contexts: List[Dict]) -> List[Dict]:
+    """Merge retrieved windows of the same source that overlap or touch.
+
+    Uses the ``start_sentence``/``end_sentence`` metadata of each context.
+    A merged context keeps the best rank of its parts (the list order is
+    preserved by first appearance) and its text in document order.
+    """
+    groups = []  # each: {'rank', 'source', 'start', 'end', 'parts': [(start, end, text, metadata)], 'context'}
+    windows = []
+    for rank, ctx in enumerate(contexts):
+        metadata = ctx.get('metadata') or {}
+        if 'start_sentence' not in metadata:
+            groups.append({'rank': rank, 'context': ctx, 'parts': None})
+        else:
+            windows.append((metadata.get('source', ''), metadata['start_sentence'], metadata['end_sentence'],
+                            rank, ctx))
+
+    # Sweep each source in document order, so a window bridging two earlier groups joins both.
+    current = None
+    for source, start, end, rank, ctx in sorted(windows, key=lambda w: w[:4]):
+        if current is not None and current['source'] == source and start <= current['end']:
+            current['parts'].append((start, end, ctx['text'], ctx['metadata']))
+            current['end'] = max(current['end'], end)
+            if rank < current['rank']:
+                current['rank'], current['context'] = rank, ctx
+            continue
+        current = {'rank': rank, 'source': source, 'start': start, 'end': end,
+                   'parts': [(start, end, ctx['text'], ctx['metadata'])], 'context': ctx}
+        groups.append(current)
+
+    merged = []
+    for group in sorted(groups, key=lambda g: g['rank']):
+        ctx = group['context']
+        if group['parts'] is None or len(group['parts']) == 1:
+            merged.append(ctx)
+            continue
+        parts = group['parts']
+        text = parts[0][2]
+        covered_end = parts[0][1]
+        for start, end, part_text, _ in parts[1:]:
+            if end <= covered_end:
+                continue  # fully inside what we already have
+            if start < covered_end:
+                text = _join_overlapping(text, part_text)
+            else:
+                text = text + " " + part_text  # touching: no shared sentences to drop
+            covered_end = end
+        metadata = {**ctx['metadata'], 'start_sentence': group['start'], 'end_sentence': group['end'],
+                    'num_sentences': group['end'] - group['start']}
+        for key, pick in (('page_start', min), ('page_end', max)):
+            pages = [part[3][key] for part in parts if key in part[3]]
+            if pages:
+                metadata[key] = pick(pages)
+        merged.append({**ctx, 'text': text, 'metadata': metadata, 'merged': len(parts)})
+    return merged
+
+
+class AnswerCache:
+    """Semantic cache of generated answers, keyed by query embedding.
+
+    A lookup returns the stored answer of the most similar cached query if
+    its cosine similarity is at least ``threshold`` and it is younger than
+    ``ttl_s`` seconds. Answers are only reused for the same generation
+    settings. At most ``max_entries`` answers are kept; the least recently
+    used one is overwritten when full. ``clear()`` drops everything and is
+    called whenever ingestion changes the collection. All methods are
+    thread-safe.
+
+    The threshold assumes a normalized sentence embedder such as ``minilm``;
+    raw [CLS] vectors (``bert-cls``) are all close to each other, so
+    ``RAGSystem`` only enables the cache with a normalized embedder.
+    """
+
+    # Two unrelated questions that must never share a cached answer.
+    PROBE = ("How do I create an index on a table?", "Who won the football world cup in 1998?")
+
+    def __init__(self, threshold: float = 0.95, ttl_s: float = 3600.0, max_entries: int = 1024):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self._matrix = None  # (max_entries, dim) unit vectors, allocated on first put
+        self._expires = np.full(self.max_entries, -np.inf)
+        self._entries: Dict[int, Dict] = {}
+        self._lru = OrderedDict()  # slot -> None, least recently used first
+        self._free = list(range(self.max_entries - 1, -1, -1))
+
+    def get(self, embedding: np.ndarray, params: Tuple = ()) -> Optional[Dict]:
+        query = embedding / max(np.linalg.norm(embedding), 1e-12)
+        with self._lock:
+            if self._matrix is None or not self._entries:
+                self.misses += 1
+                return None
+
+            scores = self._matrix @ query
+            scores[self._expires < time.monotonic()] = -np.inf
+            slot = int(np.argmax(scores))
+            entry = self._entries.get(slot)
+            if scores[slot] < self.threshold or entry is None or entry['params'] != params:
+                self.misses += 1
+                return None
+
+            self._lru.move_to_end(slot)
+            self.hits += 1
+            return {**entry, 'similarity': float(scores[slot])}
+
+    def put(self, embedding: np.ndarray, answer: str, contexts: List[Dict], params: Tuple = ()):
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, len(embedding)), dtype=np.float32)
+
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot, _ = self._lru.popitem(last=False)
+
+            self._matrix[slot] = embedding / max(np.linalg.norm(embedding), 1e-12)
+            self._expires[slot] = time.monotonic() + self.ttl_s
+            self._entries[slot] = {'answer': answer, 'contexts': contexts, 'params': params}
+            self._lru[slot] = None
+            self._lru.move_to_end(slot)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            hits, misses, entries = self.hits, self.misses, len(self._entries)
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'entries': entries
+        }
+
+
 class RAGSystem:
    
-    def __init__(self, window_size: int = 3, overlap: int = 1):
-        self.doc_processor = DocumentProcessor()
-        self.chunker = NLTKTextChunker(window_size=window_size, overlap=overlap)
-        self.embedder = BERTEmbedder()
-        self.vector_store = ChromaVectorStore()
+    def __init__(self, window_size: int = 3, overlap: int = 1,
+                 embedding_cache_dir: Optional[str] = "./embedding_cache",
+                 llm_model: str = LLM_MODEL, pdf_workers: Optional[int] = None,
+                 vector_backend: str = "chroma", vector_store_options: Optional[Dict] = None,
+                 answer_cache: Optional[AnswerCache] = None, embedding_backend: str = "bert-cls",
+                 embedding_options: Optional[Dict] = None, hybrid: bool = False,
+                 lexical_index_path: Optional[str] = "./lexical_index.npz", dense_k: Optional[int] = None,
+                 lexical_k: int = 20, context_token_budget: Optional[int] = 1024):
+        self.llm_model = llm_model
+        self.embedding_backend = embedding_backend
+        self.embedding_options = embedding_options or {}
+        self.answer_cache = answer_cache
+        self.last_query_stats = {}
+        self.doc_processor = DocumentProcessor(workers=pdf_workers)
+        self.embedder = make_embedder(embedding_backend, cache_dir=embedding_cache_dir,
+                                      **self.embedding_options)
+        if answer_cache is not None and not self.embedder.normalize:
+            print(f"Answer cache needs a normalized embedder (e.g. minilm), not {embedding_backend}; disabled")
+            self.answer_cache = None
+        # Budget chunks in embedder tokens so get_embedding never truncates them ([CLS] + [SEP] = 2).
+        self.chunker = NLTKTextChunker(window_size=window_size, overlap=overlap,
+                                       max_tokens=self.embedder.max_length - 2,
+                                       tokenizer=self.embedder.tokenizer)
+        self.vector_store = make_vector_store(vector_backend, dim=self.embedder.dim,
+                                              embedding_model=self.embedder.identity,
+                                              **(vector_store_options or {}))
+
+        # Hybrid retrieval: BM25 over the same chunks, fused with the dense hits by RRF.
+        self.dense_k = dense_k
+        self.lexical_k = lexical_k
+        self.context_token_budget = context_token_budget
+        self.lexical_index = None
+        if hybrid:
+            self.lexical_index = BM25Index(persist_path=lexical_index_path)
+            if len(self.lexical_index) == 0:
+                self._rebuild_lexical_index()
         
-        self.system_prompt = """You are a helpful assistant that answers questions based ONLY on the provided context.
+        # The instructions never change, so they form a fixed prefix whose KV cache
+        # is computed once; only the query template is prefilled per question.
+        self.system_prefix = """You are a helpful assistant that answers questions based ONLY on the provided context.
 
 CRITICAL INSTRUCTIONS:
 1. Use ONLY the information from the context provided below
@@ -191,86 +1878,432 @@ CRITICAL INSTRUCTIONS:
 4. Do NOT hallucinate or invent information
 5. If you're unsure, admit it rather than guessing
 
-Context:
-{context}
+"""
+        self.query_template = """Context:
+{{context}}
 
-Question: {question}
+Question: {{question}}
 
 Answer:"""
+        # The whole prompt as a str.format template, as it was before the compiled template.
+        self.system_prompt = self.system_prefix + self.query_template.replace("{{context}}", "{context}") \
+            .replace("{{question}}", "{question}")
+        self._piece_ids: Dict[str, List[int]] = {}  # context header/separator text -> LLM token ids
+        # Parsed once; bound to the LLM tokenizer on first use so the fixed
+        # text is tokenized once and requests only tokenize context and question.
+        self.prompt_template = CompiledTemplate(static=self.system_prefix, dynamic=self.query_template)
+
+    @property
+    def generator(self) -> LLMGenerator:
+        return get_generator(self.llm_model)
+
+    def _rebuild_lexical_index(self, batch_size: int = 1000):
+        batch = []
+        for chunk_id, text in self.vector_store.iter_documents(batch_size):
+            batch.append({'id': chunk_id, 'text': text})
+            if len(batch) == batch_size:
+                self.lexical_index.add(batch)
+                batch = []
+        self.lexical_index.add(batch)
+        if len(self.lexical_index):
+            print(f"Built lexical index over {len(self.lexical_index)} stored chunks")
+            self.lexical_index.persist()
+
+    def store_chunks(self, chunks: List[Dict], embeddings: np.ndarray):
+        """Write id-tagged chunks to the vector store and, if enabled, the lexical index."""
+        with telemetry.span("store", chunks=len(chunks)):
+            self.vector_store.add_documents(chunks, embeddings)
+            if self.lexical_index is not None:
+                self.lexical_index.add(chunks)
+        telemetry.count("rag_chunks_stored_total", len(chunks))
+
+    def delete_chunks(self, ids: List[str]):
+        with telemetry.span("delete", chunks=len(ids)):
+            self.vector_store.delete_ids(ids)
+            if self.lexical_index is not None:
+                self.lexical_index.remove(ids)
+        telemetry.count("rag_chunks_deleted_total", len(ids))
+
+    def persist_indexes(self):
+        with telemetry.span("persist"):
+            self.vector_store.persist()
+            if self.lexical_index is not None:
+                self.lexical_index.persist()
+
+    def warmup(self):
+        self.generator.warmup(prompt=self.build_query_text("warmup", []), prefix=self.system_prefix)
+        if self.answer_cache is not None:
+            self.check_answer_cache()
+
+    def check_answer_cache(self) -> float:
+        """Disable the answer cache if two clearly different questions would hit each other.
+
+        Returns their cosine similarity under the current embedder.
+        """
+        a, b = self.embedder.batch_embed(list(AnswerCache.PROBE))
+        similarity = float(a @ b / max(np.linalg.norm(a) * np.linalg.norm(b), 1e-12))
+        if similarity >= self.answer_cache.threshold:
+            print(f"Answer cache disabled: unrelated questions have similarity {similarity:.3f} "
+                  f">= threshold {self.answer_cache.threshold}")
+            self.answer_cache = None
+        return similarity
     
-    def ingest_document(self, file_path: str):
+    def ingest_document(self, file_path: str, batch_size: int = 256,
+                        manifest_path: Optional[str] = "./ingest_manifest.json"):
+        """Ingest a PDF, streaming pages through chunking, embedding and storage.
+
+        Chunks are processed ``batch_size`` at a time as pages arrive, so only
+        one batch is held in memory. Chunks already stored for this source are
+        skipped, and stored chunks that no longer appear are deleted at the end.
+
+        If the file matches its entry in the manifest at ``manifest_path`` and
+        the store still holds all of its chunks, nothing is read or embedded.
+        """
+        from ingest_pipeline import load_manifest, save_manifest, is_unchanged, manifest_entry
+
+        manifest = load_manifest(manifest_path)
+        entry = manifest.get(file_path)
+        existing = self.vector_store.get_source_metadata(file_path)
+        if is_unchanged(file_path, entry) and len(existing) == entry['chunks']:
+            save_manifest(manifest_path, manifest)  # is_unchanged may have refreshed the mtime
+            print(f"{file_path} unchanged since last ingest ({len(existing)} chunks stored), skipping")
+            return
+        # Fingerprint before reading, so a write during ingestion is picked up next time.
+        entry = manifest_entry(file_path)
+
         print("\n" + "="*60)
         print("STARTING DOCUMENT INGESTION")
         print("="*60)
         
+        with telemetry.span("ingest", source=file_path) as span:
+            seen_digests = {}
+            seen_ids = set()
+            counts = {'chunks': 0, 'new': 0, 'moved': 0, 'pages': 0}
 
-        print("\n[1/4] Loading document...")
-        text = self.doc_processor.load_pdf_document(file_path)
-        print(f"Loaded document with {len(text)} characters")
-        
-        print("\n[2/4] Chunking text with NLTK...")
-        chunks = self.chunker.chunk_text(text)
-        print(f"Created {len(chunks)} chunks")
-        
-        print("\n[3/4] Generating BERT embeddings...")
-        texts = [chunk['text'] for chunk in chunks]
-        embeddings = self.embedder.batch_embed(texts)
-        print(f"Generated {len(embeddings)} embeddings")
-        
-        print("\n[4/4] Storing in ChromaDB...")
-        self.vector_store.add_documents(chunks, embeddings)
+            print("\n[1/2] Loading, chunking, embedding and storing...")
+            pages = self.doc_processor.iter_pdf_pages(file_path)
+            chunk_stream = self.chunker.chunk_pages(pages)
+            while True:
+                with telemetry.span("extract_chunk"):
+                    chunks = list(islice(chunk_stream, batch_size))
+                if not chunks:
+                    break
+
+                self.vector_store.assign_chunk_ids(chunks, file_path, seen_digests)
+                seen_ids.update(chunk['id'] for chunk in chunks)
+                new_chunks, moved_chunks = self.vector_store.diff_chunks(chunks, existing)
+                counts['chunks'] += len(chunks)
+                counts['new'] += len(new_chunks)
+                counts['moved'] += len(moved_chunks)
+                counts['pages'] = chunks[-1].get('page_end', counts['pages'])
+                print(f"Chunks {counts['chunks'] - len(chunks)}-{counts['chunks']} "
+                      f"(up to page {chunks[-1].get('page_end', '?')}): "
+                      f"{len(new_chunks)} new, {len(moved_chunks)} moved")
+
+                if new_chunks:
+                    embeddings = self.embedder.batch_embed([chunk['text'] for chunk in new_chunks], verbose=True)
+                    self.store_chunks(new_chunks, embeddings)
+                self.vector_store.update_metadata(moved_chunks)
+
+            print("\n[2/2] Removing stale chunks...")
+            stale_ids = [chunk_id for chunk_id in existing if chunk_id not in seen_ids]
+            self.delete_chunks(stale_ids)
+            self.persist_indexes()
+            span.set(chunks=counts['chunks'], new=counts['new'], moved=counts['moved'], removed=len(stale_ids))
+
+        entry.update(pages=counts['pages'], chunks=counts['chunks'], ingested_at=time.time())
+        manifest[file_path] = entry
+        save_manifest(manifest_path, manifest)
+
+        if self.answer_cache is not None and (counts['new'] or counts['moved'] or stale_ids):
+            self.answer_cache.clear()
+            print("Collection changed, answer cache cleared")
+
+        print(f"{counts['chunks']} chunks: {counts['new']} new, {counts['moved']} moved, "
+              f"{len(stale_ids)} removed, "
+              f"{counts['chunks'] - counts['new'] - counts['moved']} unchanged")
+        if self.embedder.cache is not None:
+            print(f"Embedding cache stats: {self.embedder.cache.stats()}")
         
         print("\n" + "="*60)
         print("INGESTION COMPLETE")
         print("="*60)
     
-    def query(self, question: str, n_results: int = 3) -> Tuple[str, List[Dict]]:
-        print(f"\n[QUERY] {question}")
-        
-        # Generate query embedding
-        query_embedding = self.embedder.get_embedding(question)
-    
-        # Retrieve relevant chunks
-        results = self.vector_store.search(query_embedding, n_results=n_results)
-        
-        # Format context
+    def ingest_documents(self, file_paths: List[str], **pipeline_options) -> Dict:
+        """Ingest many PDFs through the multi-process ``IngestPipeline``.
+
+        ``pipeline_options`` are passed to ``IngestPipeline`` (worker counts,
+        queue and batch sizes, manifest path). Returns the pipeline stats.
+        """
+        return self._run_pipeline(file_paths, None, pipeline_options)
+
+    def ingest_directory(self, root: str, pattern: str = "*.pdf", **pipeline_options) -> Dict:
+        """Ingest every file under ``root`` matching ``pattern``.
+
+        Files unchanged since the last run (per the manifest) are skipped, and
+        chunks of files that disappeared from ``root`` are removed.
+        """
+        from ingest_pipeline import find_documents
+
+        return self._run_pipeline(find_documents(root, pattern), root, pipeline_options)
+
+    def _run_pipeline(self, file_paths: List[str], prune_root: Optional[str], pipeline_options: Dict) -> Dict:
+        from ingest_pipeline import IngestPipeline, format_report
+
+        stats = IngestPipeline(self, **pipeline_options).run(file_paths, prune_root=prune_root)
+        print(format_report(stats))
+        if self.answer_cache is not None and (stats['new'] or stats['moved'] or stats['removed']):
+            self.answer_cache.clear()
+        return stats
+
+    @staticmethod
+    def _contexts_from_results(results: Dict, q: int = 0) -> List[Dict]:
         contexts = []
-        if results['documents'] and len(results['documents'][0]) > 0:
-            for i, (doc, metadata, distance) in enumerate(zip(
-                results['documents'][0],
-                results['metadatas'][0],
-                results['distances'][0]
-            )):
+        if results['documents'] and len(results['documents'][q]) > 0:
+            for chunk_id, doc, metadata, distance in zip(
+                results['ids'][q],
+                results['documents'][q],
+                results['metadatas'][q],
+                results['distances'][q]
+            ):
                 contexts.append({
+                    'id': chunk_id,
                     'text': doc,
                     'metadata': metadata,
                     'similarity': 1 - distance 
                 })
-        
-        context_text = "\n\n".join([f"[Context {i+1}]: {ctx['text']}" 
-                                     for i, ctx in enumerate(contexts)])
-        
-        prompt = self.system_prompt.format(context=context_text, question=question)
-        tokenizer = AutoTokenizer.from_pretrained(LLM_MODEL)
-        inputs = tokenizer(prompt, return_tensors="pt").to(llm.device)
-        outputs = llm.generate(
-            **inputs,
-            max_new_tokens=200,
-            temperature=0.7
-        )
+        return contexts
 
-        print(tokenizer.decode(outputs[0], skip_special_tokens=True))
+    def _fuse(self, question: str, dense_contexts: List[Dict], n_results: int) -> List[Dict]:
+        """Reciprocal-rank-fuse dense contexts with BM25 hits for ``question``."""
+        lexical_ids = [chunk_id for chunk_id, _ in self.lexical_index.search(question, k=self.lexical_k)]
+        fused = reciprocal_rank_fusion([[ctx['id'] for ctx in dense_contexts], lexical_ids])[:n_results]
+
+        by_id = {ctx['id']: ctx for ctx in dense_contexts}
+        lexical_only = self.vector_store.get_by_ids([chunk_id for chunk_id, _ in fused if chunk_id not in by_id])
+        contexts = []
+        for chunk_id, score in fused:
+            if chunk_id in by_id:
+                contexts.append({**by_id[chunk_id], 'score': score})
+            elif chunk_id in lexical_only:
+                contexts.append({'id': chunk_id, **lexical_only[chunk_id], 'similarity': None, 'score': score})
+        return contexts
+
+    def retrieve(self, question: str, n_results: int = 3,
+                 query_embedding: Optional[np.ndarray] = None) -> List[Dict]:
+        # Generate query embedding
+        if query_embedding is None:
+            query_embedding = self.embedder.get_embedding(question)
+    
+        # Retrieve relevant chunks
+        dense_k = self.dense_k or n_results
+        with telemetry.span("retrieve", queries=1, k=dense_k):
+            results = self.vector_store.search(query_embedding, n_results=dense_k)
+            contexts = self._contexts_from_results(results)
+            if self.lexical_index is not None:
+                contexts = self._fuse(question, contexts, n_results)
+        return contexts
+
+    def retrieve_batch(self, questions: List[str], n_results: int = 3,
+                       query_embeddings: Optional[np.ndarray] = None) -> List[List[Dict]]:
+        if query_embeddings is None:
+            query_embeddings = self.embedder.batch_embed(questions)
+        dense_k = self.dense_k or n_results
+        with telemetry.span("retrieve", queries=len(questions), k=dense_k):
+            results = self.vector_store.search_batch(query_embeddings, n_results=dense_k)
+            all_contexts = [self._contexts_from_results(results, q) for q in range(len(questions))]
+            if self.lexical_index is not None:
+                all_contexts = [self._fuse(question, contexts, n_results)
+                                for question, contexts in zip(questions, all_contexts)]
+        return all_contexts
+
+    def pack_contexts(self, contexts: List[Dict], token_budget: Optional[int] = None,
+                      min_tokens: int = 32) -> List[Dict]:
+        """Merge overlapping windows, then keep contexts in rank order until
+        ``token_budget`` LLM tokens are used. The first context that does not
+        fit is cut to the remaining budget if at least ``min_tokens`` remain.
+        Each packed context gets a ``num_tokens`` count and its ``token_ids``,
+        which ``build_query_ids`` reuses instead of tokenizing the text again.
+        Both cover the text as it appears after its ``[Context n]:`` header,
+        i.e. with the separating space."""
+        contexts = merge_contexts(contexts)
+        budget = token_budget or self.context_token_budget
+        if budget is None:
+            return contexts
+
+        tokenizer = self.generator.tokenizer
+        header_tokens = len(tokenizer("[Context 10]:\n\n", add_special_tokens=False)['input_ids'])
+        packed = []
+        used = 0
+        for ctx in contexts:
+            ids = tokenizer(" " + ctx['text'], add_special_tokens=False)['input_ids']
+            cost = len(ids) + header_tokens
+            if used + cost <= budget:
+                packed.append({**ctx, 'num_tokens': len(ids), 'token_ids': ids})
+                used += cost
+                continue
+            remaining = budget - used - header_tokens
+            if remaining >= min_tokens:
+                packed.append({**ctx, 'text': tokenizer.decode(ids[:remaining]).removeprefix(" "),
+                               'num_tokens': remaining, 'token_ids': ids[:remaining], 'truncated': True})
+            break
+        return packed
+
+    @staticmethod
+    def _context_text(contexts: List[Dict]) -> str:
+        return "\n\n".join([f"[Context {i+1}]: {ctx['text']}" 
+                             for i, ctx in enumerate(contexts)])
+
+    def build_query_text(self, question: str, contexts: List[Dict]) -> str:
+        """The per-question part of the prompt, i.e. everything after ``system_prefix``."""
+        return self.prompt_template.render_dynamic(context=self._context_text(contexts), question=question)
+
+    def _tokenize_piece(self, text: str) -> List[int]:
+        ids = self._piece_ids.get(text)
+        if ids is None:
+            ids = self._piece_ids[text] = self.generator.tokenizer(text, add_special_tokens=False)['input_ids']
+        return ids
+
+    def _context_ids(self, contexts: List[Dict]) -> List[int]:
+        """Token ids of ``_context_text``, reusing the ``token_ids`` left by ``pack_contexts``.
+
+        The space after each header is tokenized with the context text, as
+        BPE tokenizers attach it to the first word.
+        """
+        ids = []
+        for i, ctx in enumerate(contexts):
+            if i:
+                ids.extend(self._tokenize_piece("\n\n"))
+            ids.extend(self._tokenize_piece(f"[Context {i+1}]:"))
+            if 'token_ids' in ctx:
+                ids.extend(ctx['token_ids'])
+            else:
+                ids.extend(self.generator.tokenizer(" " + ctx['text'], add_special_tokens=False)['input_ids'])
+        return ids
+
+    def build_query_ids(self, question: str, contexts: List[Dict]) -> List[int]:
+        """Token ids of ``build_query_text``; the template's fixed text is pre-tokenized and
+        packed contexts are not tokenized again."""
+        if self.prompt_template.tokenizer is None:
+            self.prompt_template.bind(self.generator.tokenizer)
+        return self.prompt_template.encode_dynamic(context=self._context_ids(contexts), question=question)
+
+    def build_prompt(self, question: str, contexts: List[Dict]) -> str:
+        return self.prompt_template.render(context=self._context_text(contexts), question=question)
+
+    def query_stream(self, question: str, n_results: int = 3, max_new_tokens: int = 200,
+                     stats: Optional[Dict] = None) -> Iterator[str]:
+        """Stream the answer to ``question`` token by token.
+
+        ``stats`` receives the retrieved contexts, retrieval time and the
+        generator's TTFT, tokens/sec and latency, measured from the moment the
+        question arrives. It is also kept as ``self.last_query_stats``.
+        With an answer cache, a hit yields the cached answer in one piece
+        and sets ``stats['cache_hit']``.
+        """
+        stats = {} if stats is None else stats
+        start = time.perf_counter()
+        query_embedding = self.embedder.get_embedding(question)
+        params = (n_results, max_new_tokens)
+
+        cached = self.answer_cache.get(query_embedding, params) if self.answer_cache is not None else None
+        stats['cache_hit'] = cached is not None
+        telemetry.count("rag_queries_total", cache_hit=stats['cache_hit'])
+        if cached is not None:
+            stats['contexts'] = cached['contexts']
+            stats['ttft_s'] = stats['total_s'] = time.perf_counter() - start
+            self.last_query_stats = stats
+            yield cached['answer']
+            return
+
+        contexts = self.retrieve(question, n_results=n_results, query_embedding=query_embedding)
+        stats['retrieve_s'] = time.perf_counter() - start
+        contexts = self.pack_contexts(contexts)
+        stats['context_tokens'] = sum(ctx.get('num_tokens', 0) for ctx in contexts)
+        stats['contexts'] = contexts
+
+        query_ids = self.build_query_ids(question, contexts)
+        gen_stats = {}
+        pieces = []
+        for piece in self.generator.stream(query_ids, max_new_tokens=max_new_tokens, temperature=0.7,
+                                           stats=gen_stats, prefix=self.system_prefix):
+            pieces.append(piece)
+            yield piece
+
+        stats.update(gen_stats)
+        stats['ttft_s'] = stats['retrieve_s'] + gen_stats['ttft_s']
+        stats['total_s'] = time.perf_counter() - start
+        self.last_query_stats = stats
+        telemetry.observe("rag_query_seconds", stats['total_s'])
+        telemetry.count("rag_context_tokens_total", stats['context_tokens'])
+        if self.answer_cache is not None:
+            self.answer_cache.put(query_embedding, "".join(pieces), contexts, params)
+    
+    def query(self, question: str, n_results: int = 3) -> Tuple[str, List[Dict]]:
+        print(f"\n[QUERY] {question}")
+        stats = {}
+        answer = "".join(self.query_stream(question, n_results=n_results, stats=stats))
+        print(answer)
+        return answer, stats['contexts']
+
+    def query_batch(self, questions: List[str], n_results: int = 3, max_new_tokens: int = 200,
+                    batch_size: int = 8) -> List[Tuple[str, List[Dict]]]:
+        """Answer many questions: one batched embedding pass, one multi-query
+        search and left-padded batched generation. Returns ``(answer, contexts)``
+        per question, in input order. Answer-cache hits skip retrieval and
+        generation."""
+        query_embeddings = self.embedder.batch_embed(questions)
+        params = (n_results, max_new_tokens)
+        results: List[Optional[Tuple[str, List[Dict]]]] = [None] * len(questions)
+
+        misses = []
+        for i, embedding in enumerate(query_embeddings):
+            cached = self.answer_cache.get(embedding, params) if self.answer_cache is not None else None
+            if cached is None:
+                misses.append(i)
+            else:
+                results[i] = (cached['answer'], cached['contexts'])
+        telemetry.count("rag_queries_total", len(questions) - len(misses), cache_hit=True)
+        telemetry.count("rag_queries_total", len(misses), cache_hit=False)
+        if not misses:
+            return results
+
+        all_contexts = self.retrieve_batch([questions[i] for i in misses], n_results=n_results,
+                                           query_embeddings=query_embeddings[misses])
+        all_contexts = [self.pack_contexts(contexts) for contexts in all_contexts]
+        prompts = [self.build_prompt(questions[i], contexts)
+                   for i, contexts in zip(misses, all_contexts)]
+        answers = self.generator.generate_batch(prompts, max_new_tokens=max_new_tokens, temperature=0.7,
+                                                batch_size=batch_size)
+        for i, answer, contexts in zip(misses, answers, all_contexts):
+            results[i] = (answer, contexts)
+            if self.answer_cache is not None:
+                self.answer_cache.put(query_embeddings[i], answer, contexts, params)
+        return results
         
 
 
 if __name__ == "__main__":
-    rag = RAGSystem(window_size=3, overlap=1)
+    rag = RAGSystem(window_size=3, overlap=1, pdf_workers=os.cpu_count(), answer_cache=AnswerCache(),
+                    embedding_backend="minilm", hybrid=True)
     
-    print("\nTo ingest a document, use:")
-    rag.ingest_document("docs.pdf")
+    # python rag_system.py [file.pdf | directory]
+    source = sys.argv[1] if len(sys.argv) > 1 else "docs.pdf"
+    if os.path.isdir(source):
+        rag.ingest_directory(source)
+    else:
+        rag.ingest_document(source)
+    rag.warmup()
     while(True):
         string = input("Please enter the query : ")
         if string.upper() != "BYE":
-            rag.query(string)
+            stats = {}
+            for token in rag.query_stream(string, stats=stats):
+                print(token, end="", flush=True)
+            if stats['cache_hit']:
+                print(f"\n[cached answer | total {stats['total_s']*1000:.1f} ms]")
+            else:
+                print(f"\n[ttft {stats['ttft_s']*1000:.0f} ms | {stats['tokens_per_s']:.1f} tok/s | "
+                      f"total {stats['total_s']:.2f} s]")
         else:
             break
@@ -0,0 +1,290 @@
+"""
+Opt-in tracing and metrics for the RAG pipeline
+Nested spans, counters and histograms, exported as Prometheus text or as
+OTLP/JSON lines (the format of the OpenTelemetry collector's file exporter).
+
+Everything is off by default: ``span`` then returns a shared no-op object
+and ``count``/``observe`` return after a single flag check, so the calls can
+stay in hot paths. Turn it on with ``enable(...)`` or the environment:
+
+    RAG_TELEMETRY_PROMETHEUS=metrics.prom   write Prometheus text on flush/exit
+    RAG_TELEMETRY_OTLP=traces.jsonl         append OTLP/JSON spans and metrics on flush/exit
+"""
+
+import atexit
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+
+_enabled = False
+_lock = threading.Lock()
+_local = threading.local()
+_counters: Dict[Tuple[str, Tuple], float] = {}
+_histograms: Dict[Tuple[str, Tuple], "Histogram"] = {}
+_finished_spans: deque = deque(maxlen=10_000)
+_exporters = {'prometheus': None, 'otlp': None}
+_service_name = "rag-system"
+_atexit_registered = False
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """A timed, nested unit of work. Use as a context manager.
+
+    The parent is whatever span is open on the current thread when this one
+    starts. On exit the duration is recorded in the ``rag_span_seconds``
+    histogram (labelled by span name) and the span is kept for OTLP export.
+    """
+
+    def __init__(self, name: str, attrs: Dict):
+        self.name = name
+        self.attrs = attrs
+        self.span_id = os.urandom(8).hex()
+        self.trace_id = None
+        self.parent_id = None
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error = False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = _span_stack()
+        if stack:
+            self.trace_id, self.parent_id = stack[-1].trace_id, stack[-1].span_id
+        else:
+            self.trace_id = os.urandom(16).hex()
+        stack.append(self)
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        self.error = exc_type is not None
+        stack = _span_stack()
+        # Spans opened around generators may close out of order; remove this one wherever it is.
+        if stack and stack[-1] is self:
+            stack.pop()
+        elif self in stack:
+            stack.remove(self)
+        observe("rag_span_seconds", (self.end_ns - self.start_ns) / 1e9, span=self.name)
+        with _lock:
+            _finished_spans.append(self)
+        return False
+
+
+def _span_stack() -> List[Span]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _key(name: str, labels: Dict) -> Tuple[str, Tuple]:
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def span(name: str, **attrs):
+    """Context manager timing a stage; a shared no-op when telemetry is disabled."""
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(name, attrs)
+
+
+def count(name: str, value: float = 1, **labels):
+    """Add ``value`` to the counter ``name`` (Prometheus convention: end it in ``_total``)."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, value: float, **labels):
+    """Record ``value`` in the histogram ``name``; ``*_seconds`` names use latency buckets, others size buckets."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(LATENCY_BUCKETS if name.endswith("_seconds") else SIZE_BUCKETS)
+        histogram.observe(value)
+
+
+def enable(prometheus_path: Optional[str] = None, otlp_path: Optional[str] = None,
+           service_name: str = "rag-system"):
+    """Turn telemetry on. Configured exporters are written by ``flush`` and at interpreter exit."""
+    global _enabled, _service_name, _atexit_registered
+    _exporters['prometheus'] = prometheus_path
+    _exporters['otlp'] = otlp_path
+    _service_name = service_name
+    _enabled = True
+    if not _atexit_registered:
+        atexit.register(flush)
+        _atexit_registered = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _finished_spans.clear()
+
+
+def _format_labels(labels: Tuple, extra: Optional[Tuple] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = ((str(v).lower() if isinstance(v, bool) else str(v)).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def prometheus_text() -> str:
+    """Current counters and histograms in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(_histograms.items(), key=lambda item: item[0])
+        lines = []
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), histogram in histograms:
+            if name not in declared:
+                lines.append(f"# TYPE {name} histogram")
+                declared.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', f'{bound:g}'))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {histogram.count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+def _otlp_attributes(attrs) -> List[Dict]:
+    out = []
+    for key, value in (attrs.items() if isinstance(attrs, dict) else attrs):
+        if isinstance(value, bool):
+            out.append({'key': key, 'value': {'boolValue': value}})
+        elif isinstance(value, int):
+            out.append({'key': key, 'value': {'intValue': str(value)}})
+        elif isinstance(value, float):
+            out.append({'key': key, 'value': {'doubleValue': value}})
+        else:
+            out.append({'key': key, 'value': {'stringValue': str(value)}})
+    return out
+
+
+def otlp_records() -> List[Dict]:
+    """Drain finished spans and snapshot metrics as OTLP/JSON export requests."""
+    resource = {'attributes': _otlp_attributes({'service.name': _service_name})}
+    scope = {'name': "rag_system.telemetry"}
+    now = str(time.time_ns())
+    with _lock:
+        spans = list(_finished_spans)
+        _finished_spans.clear()
+        counters = list(_counters.items())
+        histograms = [(key, h.buckets, list(h.counts), h.sum, h.count) for key, h in _histograms.items()]
+
+    records = []
+    if spans:
+        records.append({'resourceSpans': [{'resource': resource, 'scopeSpans': [{'scope': scope, 'spans': [{
+            'traceId': s.trace_id,
+            'spanId': s.span_id,
+            **({'parentSpanId': s.parent_id} if s.parent_id else {}),
+            'name': s.name,
+            'kind': 1,
+            'startTimeUnixNano': str(s.start_ns),
+            'endTimeUnixNano': str(s.end_ns),
+            'attributes': _otlp_attributes(s.attrs),
+            'status': {'code': 2 if s.error else 1}
+        } for s in spans]}]}]})
+
+    metrics = []
+    for (name, labels), value in counters:
+        metrics.append({'name': name, 'sum': {
+            'aggregationTemporality': 2, 'isMonotonic': True,
+            'dataPoints': [{'attributes': _otlp_attributes(labels), 'timeUnixNano': now, 'asDouble': value}]}})
+    for (name, labels), buckets, counts, total, n in histograms:
+        metrics.append({'name': name, 'histogram': {
+            'aggregationTemporality': 2,
+            'dataPoints': [{'attributes': _otlp_attributes(labels), 'timeUnixNano': now, 'count': str(n),
+                            'sum': total, 'explicitBounds': list(buckets),
+                            'bucketCounts': [str(c) for c in counts]}]}})
+    if metrics:
+        records.append({'resourceMetrics': [{'resource': resource,
+                                             'scopeMetrics': [{'scope': scope, 'metrics': metrics}]}]})
+    return records
+
+
+def flush():
+    """Write the configured exporters: Prometheus text is rewritten, OTLP lines are appended."""
+    if _exporters['prometheus']:
+        tmp_path = _exporters['prometheus'] + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, _exporters['prometheus'])
+    if _exporters['otlp']:
+        records = otlp_records()
+        if records:
+            with open(_exporters['otlp'], "a") as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+
+
+# Only the main process exports; spawned ingest workers would overwrite its files.
+if multiprocessing.parent_process() is None and (os.environ.get("RAG_TELEMETRY_PROMETHEUS")
+                                                 or os.environ.get("RAG_TELEMETRY_OTLP")):
+    enable(prometheus_path=os.environ.get("RAG_TELEMETRY_PROMETHEUS"),
+           otlp_path=os.environ.get("RAG_TELEMETRY_OTLP"))
@@ -0,0 +1,38 @@
+import pytest
+
+for module in ("numpy", "torch", "transformers", "chromadb", "nltk", "PyPDF2"):
+    pytest.importorskip(module)
+
+import numpy as np  # noqa: E402
+from rag_system import AnswerCache  # noqa: E402
+
+
+def unit(seed, dim=64):
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_near_duplicate_hits_and_different_question_misses():
+    cache = AnswerCache(threshold=0.95)
+    question = unit(0)
+    cache.put(question, "answer", [], params=(3, 200))
+
+    paraphrase = question + 0.05 * unit(1)
+    hit = cache.get(paraphrase, params=(3, 200))
+    assert hit is not None and hit['answer'] == "answer"
+
+    assert cache.get(unit(2), params=(3, 200)) is None
+    assert cache.get(paraphrase, params=(5, 200)) is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_evicts_least_recently_used_and_expires():
+    cache = AnswerCache(max_entries=2)
+    for seed in range(3):
+        cache.put(unit(seed), f"answer {seed}", [])
+    assert cache.get(unit(0)) is None
+    assert cache.get(unit(2))['answer'] == "answer 2"
+
+    expired = AnswerCache(ttl_s=-1)
+    expired.put(unit(0), "answer", [])
+    assert expired.get(unit(0)) is None
@@ -0,0 +1,77 @@
+import pytest
+
+for module in ("numpy", "torch", "transformers", "chromadb", "nltk", "PyPDF2"):
+    pytest.importorskip(module)
+
+import numpy as np  # noqa: E402
+from rag_system import BM25Index, reciprocal_rank_fusion  # noqa: E402
+
+TEXTS = {
+    "wal": "Raise max_wal_size to spread checkpoints out.",
+    "vacuum": "Autovacuum removes dead tuples; run VACUUM after bulk deletes.",
+    "activity": "Query pg_stat_activity to see running queries.",
+    "index": "A B-tree index speeds up equality and range queries.",
+}
+
+
+def chunks(ids):
+    return [{'id': chunk_id, 'text': TEXTS[chunk_id]} for chunk_id in ids]
+
+
+def top_ids(index, query, k=10):
+    return [chunk_id for chunk_id, _ in index.search(query, k=k)]
+
+
+def test_identifiers_match_whole_and_by_part():
+    assert {"pg_stat_activity", "pg", "stat", "activity"} <= set(BM25Index.tokenize("pg_stat_activity"))
+    index = BM25Index()
+    index.add(chunks(TEXTS))
+    assert top_ids(index, "pg_stat_activity")[0] == "activity"
+    assert top_ids(index, "wal size")[0] == "wal"
+    assert top_ids(index, "nothing matches this") == []
+
+
+def test_remove_and_overwrite_hide_old_rows():
+    index = BM25Index(compact_ratio=1.0)
+    index.add(chunks(TEXTS))
+    index.remove(["vacuum", "missing"])
+    assert "vacuum" not in top_ids(index, "vacuum dead tuples")
+    index.add([{'id': "wal", 'text': "Tune checkpoint_timeout instead."}])
+    assert top_ids(index, "max_wal_size") == []
+    assert top_ids(index, "checkpoint_timeout") == ["wal"]
+    assert len(index) == 3 and len(index.deleted) == 2
+
+
+def test_compaction_keeps_results():
+    index = BM25Index(compact_ratio=1.0)
+    index.add(chunks(TEXTS))
+    index.remove(["vacuum", "index"])
+    before = top_ids(index, "queries checkpoints")
+
+    index.compact_ratio = 0.1
+    index._maybe_compact()
+    assert not index.deleted and index.ids == ["wal", "activity"]
+    assert top_ids(index, "queries checkpoints") == before == ["wal", "activity"]
+
+
+def test_persist_round_trip(tmp_path):
+    path = str(tmp_path / "lexical")
+    index = BM25Index(persist_path=path, compact_ratio=1.0)
+    index.add(chunks(TEXTS) + [{'id': "naïve", 'text': "Unicode ids survive."}])
+    index.remove(["vacuum"])
+    index.persist()
+
+    reopened = BM25Index(persist_path=path)
+    assert len(reopened) == len(index)
+    assert reopened.total_length == index.total_length
+    for query in ("pg_stat_activity", "queries", "unicode", "vacuum"):
+        assert reopened.search(query) == index.search(query)
+    with np.load(path + ".npz") as state:
+        assert all(state[name].dtype != object for name in state.files)
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    assert [item for item, _ in fused] == ["b", "a", "d", "c"]
+    assert dict(fused)["b"] == pytest.approx(1 / 62 + 1 / 61)
+    assert reciprocal_rank_fusion([]) == []
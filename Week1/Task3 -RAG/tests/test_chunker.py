@@ -0,0 +1,64 @@
+import random
+import re
+
+import pytest
+
+for module in ("numpy", "torch", "transformers", "chromadb", "nltk", "PyPDF2"):
+    pytest.importorskip(module)
+
+import rag_system  # noqa: E402
+from rag_system import NLTKTextChunker  # noqa: E402
+
+FIELDS = ('text', 'start_sentence', 'end_sentence', 'num_sentences', 'chunk_id')
+
+
+def split_sentences(text):
+    return [sentence for sentence in re.split(r"(?<=\.)\s+", text) if sentence]
+
+
+def word_tokenizer(text, add_special_tokens=False):
+    return {'input_ids': text.split()}
+
+
+def sentences(n, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(f"w{i}_{j}" for j in range(rng.randint(1, 12))) + "." for i in range(n)]
+
+
+@pytest.fixture(autouse=True)
+def plain_sentence_splitter(monkeypatch):
+    # chunk_text uses nltk's punkt model; the windows do not depend on how sentences are found.
+    monkeypatch.setattr(rag_system, "sent_tokenize", split_sentences)
+
+
+@pytest.mark.parametrize("window_size, overlap", [(3, 1), (4, 2), (2, 0), (1, 0), (5, 4)])
+@pytest.mark.parametrize("count", [0, 1, 2, 3, 4, 7, 10])
+def test_windows_match_chunk_text_without_budget(window_size, overlap, count):
+    chunker = NLTKTextChunker(window_size=window_size, overlap=overlap)
+    text = " ".join(sentences(count))
+    expected = [{key: chunk[key] for key in FIELDS} for chunk in chunker.chunk_text(text)]
+    streamed = chunker.chunk_sentences((1, sentence) for sentence in split_sentences(text))
+    assert [{key: chunk[key] for key in FIELDS} for chunk in streamed] == expected
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("max_tokens", [6, 10, 25])
+def test_budgeted_windows_never_exceed_max_tokens(seed, max_tokens):
+    chunker = NLTKTextChunker(window_size=3, overlap=1, max_tokens=max_tokens, tokenizer=word_tokenizer)
+    stream = sentences(30, seed)
+    chunks = list(chunker.chunk_sentences((1 + i // 10, sentence) for i, sentence in enumerate(stream)))
+
+    for chunk in chunks:
+        assert chunk['num_tokens'] == chunker.count_tokens(chunk['text']) <= max_tokens
+        assert 1 <= chunk['num_sentences'] <= 3
+    # Every word still lands in some chunk, and windows move forward.
+    assert set(" ".join(stream).split()) == set(" ".join(chunk['text'] for chunk in chunks).split())
+    starts = [chunk['start_sentence'] for chunk in chunks]
+    assert starts == sorted(starts) and len(set(starts)) == len(starts)
+
+
+def test_chunk_pages_records_page_range():
+    chunker = NLTKTextChunker(window_size=2, overlap=0)
+    pages = [(1, "First. Second. Third."), (2, "Fourth.")]
+    chunks = list(chunker.chunk_pages(pages))
+    assert [(chunk['page_start'], chunk['page_end']) for chunk in chunks] == [(1, 1), (1, 2)]
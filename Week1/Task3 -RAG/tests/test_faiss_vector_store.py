@@ -0,0 +1,124 @@
+import os
+
+import pytest
+
+for module in ("numpy", "torch", "transformers", "chromadb", "nltk", "PyPDF2", "faiss"):
+    pytest.importorskip(module)
+
+import numpy as np  # noqa: E402
+from rag_system import FaissVectorStore  # noqa: E402
+
+DIM = 16
+KINDS = [dict(index_type="flat"), dict(index_type="hnsw"), dict(index_type="ivf", nlist=2),
+         dict(index_type="flat", quantization="int8"), dict(index_type="flat", quantization="pq", pq_m=4)]
+
+
+def chunks(start, end, source="a.pdf"):
+    return [{'id': f"c{i}", 'text': f"text {i}", 'source': source, 'start_sentence': i, 'end_sentence': i + 1,
+             'num_sentences': 1} for i in range(start, end)]
+
+
+def vectors(n, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+
+@pytest.fixture(params=KINDS, ids=lambda kind: "-".join(str(v) for v in kind.values()))
+def options(request, tmp_path):
+    return {'dim': DIM, 'persist_directory': str(tmp_path), **request.param}
+
+
+def nearest(store, vector):
+    return store.search(vector, n_results=1)['ids'][0][0]
+
+
+def test_persist_and_reload(options):
+    data = vectors(200)
+    store = FaissVectorStore(**options)
+    store.add_documents(chunks(0, 200), data)
+    store.persist()
+
+    reopened = FaissVectorStore(**options)
+    assert reopened.count() == 200
+    assert nearest(reopened, data[7]) == "c7"
+    assert reopened.get_by_ids(["c3"])["c3"]['text'] == "text 3"
+
+
+def test_reopened_store_accepts_writes(options):
+    data = vectors(201)
+    store = FaissVectorStore(**options)
+    store.add_documents(chunks(0, 200), data[:200])
+    store.persist()
+
+    reopened = FaissVectorStore(**options)
+    reopened.add_documents(chunks(200, 201), data[200:])
+    reopened.persist()
+    reopened.persist()  # nothing changed: must not touch the files it has memory-mapped
+
+    final = FaissVectorStore(**options)
+    assert final.count() == 201
+    assert nearest(final, data[200]) == "c200"
+    assert nearest(final, data[5]) == "c5"
+
+
+def test_metadata_only_and_delete_only_persist(options):
+    data = vectors(200)
+    store = FaissVectorStore(**options)
+    store.add_documents(chunks(0, 200), data)
+    store.persist()
+
+    reopened = FaissVectorStore(**options)
+    moved = chunks(0, 1)
+    moved[0]['start_sentence'] = 50
+    reopened.update_metadata(moved)
+    reopened.persist()
+    reopened.delete_ids(["c1"])
+    reopened.persist()
+
+    final = FaissVectorStore(**options)
+    assert final.count() == 199
+    assert final.get_by_ids(["c0"])["c0"]['metadata']['start_sentence'] == 50
+    assert "c1" not in final.get_by_ids(["c1"])
+    names = os.listdir(options['persist_directory'])
+    (vectors_file,) = [name for name in names if name.endswith(".f32")]
+    assert os.path.getsize(os.path.join(options['persist_directory'], vectors_file)) == 200 * DIM * 4
+    assert not [name for name in names if name.endswith(".tmp")]
+
+
+def test_search_skips_deleted_rows(options):
+    data = vectors(300)
+    store = FaissVectorStore(**{**options, 'compact_ratio': 1.0})
+    store.add_documents(chunks(0, 300), data)
+    store.delete_ids([f"c{i}" for i in range(0, 300, 3)] + [f"c{i}" for i in range(1, 300, 3)])
+    live = {f"c{i}" for i in range(2, 300, 3)}
+
+    (found,) = store.search(data[0], n_results=20)['ids']
+    assert len(found) == 20 and set(found) <= live
+    assert nearest(store, data[5]) == "c5"
+
+
+def test_compaction_moves_vectors_to_a_new_file(options):
+    data = vectors(200)
+    store = FaissVectorStore(**{**options, 'compact_ratio': 0.1})
+    store.add_documents(chunks(0, 200), data)
+    store.persist()
+    store.delete_ids([f"c{i}" for i in range(50)])
+    store.persist()
+
+    assert len([name for name in os.listdir(options['persist_directory']) if name.endswith(".f32")]) == 1
+    final = FaissVectorStore(**options)
+    assert final.count() == 150
+    assert nearest(final, data[120]) == "c120"
+
+
+def test_source_index_follows_writes(options):
+    data = vectors(200)
+    store = FaissVectorStore(**options)
+    store.add_documents(chunks(0, 120, "a.pdf") + chunks(120, 200, "b.pdf"), data)
+    store.delete_ids(["c0", "c120"])
+    store.add_documents(chunks(1, 2, "b.pdf"), data[1:2])  # overwrite moves c1 to b.pdf
+    store.persist()
+
+    reopened = FaissVectorStore(**options)
+    assert reopened.source_count("a.pdf") == 118 and reopened.source_count("b.pdf") == 80
+    assert set(reopened.get_source_metadata("b.pdf")) == {"c1"} | {f"c{i}" for i in range(121, 200)}
+    assert reopened.source_count("missing.pdf") == 0
@@ -0,0 +1,64 @@
+import pytest
+
+for module in ("numpy", "torch", "transformers", "chromadb", "nltk", "PyPDF2"):
+    pytest.importorskip(module)
+
+from rag_system import _join_overlapping, merge_contexts  # noqa: E402
+
+SENTENCES = [f"Sentence number {i}." for i in range(12)]
+
+
+def window(start, end, source="a.pdf", **metadata):
+    return {'id': f"{source}:{start}", 'text': " ".join(SENTENCES[start:end]),
+            'metadata': {'source': source, 'start_sentence': start, 'end_sentence': end,
+                         'num_sentences': end - start, **metadata}}
+
+
+def spans(contexts):
+    return [(ctx['metadata']['start_sentence'], ctx['metadata']['end_sentence']) for ctx in contexts]
+
+
+def test_overlapping_windows_merge_in_document_order():
+    merged = merge_contexts([window(2, 5), window(0, 3), window(8, 11)])
+    assert spans(merged) == [(0, 5), (8, 11)]
+    assert merged[0]['text'] == " ".join(SENTENCES[0:5])
+    assert merged[0]['merged'] == 2
+    assert 'merged' not in merged[1]
+
+
+def test_touching_windows_are_joined_with_a_space():
+    first = {**window(0, 1), 'text': "The table"}
+    second = {**window(1, 2), 'text': "example text"}
+    (merged,) = merge_contexts([first, second])
+    assert merged['text'] == "The table example text"
+
+
+def test_bridging_window_merges_all_groups():
+    merged = merge_contexts([window(0, 3), window(6, 9), window(2, 7)])
+    assert spans(merged) == [(0, 9)]
+    assert merged[0]['text'] == " ".join(SENTENCES[0:9])
+    assert merged[0]['merged'] == 3
+
+
+def test_merged_context_keeps_best_rank_and_page_range():
+    merged = merge_contexts([window(8, 11), window(4, 7, page_start=3, page_end=3),
+                             window(0, 3), window(6, 9, page_start=3, page_end=4)])
+    assert spans(merged) == [(4, 11), (0, 3)]
+    assert merged[0]['id'] == "a.pdf:8"
+    assert (merged[0]['metadata']['page_start'], merged[0]['metadata']['page_end']) == (3, 4)
+
+
+def test_sources_and_contexts_without_positions_stay_apart():
+    plain = {'id': "x", 'text': "no metadata", 'metadata': {}}
+    merged = merge_contexts([window(0, 3, "a.pdf"), plain, window(2, 5, "b.pdf")])
+    assert [ctx['id'] for ctx in merged] == ["a.pdf:0", "x", "b.pdf:2"]
+
+
+def test_contained_window_adds_nothing():
+    (merged,) = merge_contexts([window(0, 6), window(2, 4)])
+    assert merged['text'] == " ".join(SENTENCES[0:6])
+
+
+def test_join_overlapping():
+    assert _join_overlapping("one two three", "two three four") == "one two three four"
+    assert _join_overlapping("one", "two") == "one two"
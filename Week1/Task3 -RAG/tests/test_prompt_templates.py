@@ -0,0 +1,111 @@
+import re
+
+import pytest
+
+from prompt_templates import CompiledTemplate, hr_assistant_template, parse
+
+
+class WordTokenizer:
+    """Splits like a byte-level BPE tokenizer: a space is part of the word after it."""
+
+    BOS = 0
+
+    def __init__(self):
+        self.vocab = {"<s>": self.BOS}
+        self.calls = 0
+
+    def __call__(self, text, add_special_tokens=True):
+        self.calls += 1
+        ids = [self.vocab.setdefault(piece, len(self.vocab)) for piece in re.findall(r" ?\S+|\s", text)]
+        return {'input_ids': ([self.BOS] if add_special_tokens else []) + ids}
+
+    def encode(self, text):
+        return self(text, add_special_tokens=False)['input_ids']
+
+
+POLICIES = {"Chennai": {'policy': "24 days.", 'notes': "Local holidays."},
+            "London": {'policy': "25 days.", 'notes': "Bank holidays."}}
+
+
+def template(tokenizer=None, loader=None):
+    return CompiledTemplate(static="You are an assistant.\n",
+                            semi_static="Policy for {{location}}: {{policy}}\n{{notes}}\n",
+                            dynamic="Name: {{name}}\nQuestion: {{question}}\n\nAnswer:",
+                            cache_key=("location",), tokenizer=tokenizer, loader=loader)
+
+
+REQUEST = {'location': "Chennai", 'name': "Asha", 'question': "How many days carry over?"}
+
+
+def test_parse():
+    assert parse("a {{x}} b {{ y }}") == (["a ", " b ", ""], ["x", "y"])
+    assert parse("no fields") == (["no fields"], [])
+
+
+def test_render_matches_plain_substitution():
+    rendered = template(loader=lambda location: POLICIES[location]).render(**REQUEST)
+    assert rendered == ("You are an assistant.\nPolicy for Chennai: 24 days.\nLocal holidays.\n"
+                        "Name: Asha\nQuestion: How many days carry over?\n\nAnswer:")
+
+
+def test_encode_matches_tokenizing_the_rendered_prompt():
+    tokenizer = WordTokenizer()
+    compiled = template(tokenizer, loader=lambda location: POLICIES[location])
+    assert compiled.encode(**REQUEST) == tokenizer.encode(compiled.render(**REQUEST))
+    assert WordTokenizer.BOS not in compiled.encode(**REQUEST)
+
+
+def test_token_id_values_are_used_as_is():
+    tokenizer = WordTokenizer()
+    compiled = template(tokenizer, loader=lambda location: POLICIES[location])
+    question = tokenizer.encode(REQUEST['question'])
+    ids = compiled.encode_dynamic(name="Asha", question=question)
+    # The space before the field cannot merge into given ids, so it stays a token of its own.
+    assert ids == (tokenizer.encode("Name: Asha\nQuestion:") + tokenizer.encode(" ") + question
+                   + tokenizer.encode("\n\nAnswer:"))
+
+
+def test_segment_cache_hits_and_evicts():
+    tokenizer = WordTokenizer()
+    loads = []
+
+    def loader(location):
+        loads.append(location)
+        return POLICIES[location]
+
+    compiled = CompiledTemplate(semi_static="{{location}}: {{policy}}", cache_key=("location",),
+                                tokenizer=tokenizer, loader=loader, max_cached=1)
+    first = compiled.segment(location="Chennai")
+    assert compiled.segment(location="Chennai") == first
+    compiled.segment(location="London")
+    compiled.segment(location="Chennai")
+    assert loads == ["Chennai", "London", "Chennai"]
+    assert compiled.stats() == {'cached_segments': 1, 'hits': 1, 'misses': 3}
+
+    compiled.invalidate(location="Chennai")
+    compiled.segment(location="Chennai")
+    assert loads[-1] == "Chennai" and compiled.stats()['misses'] == 4
+
+
+def test_only_field_values_are_tokenized_per_request():
+    tokenizer = WordTokenizer()
+    compiled = template(tokenizer, loader=lambda location: POLICIES[location])
+    compiled.encode(**REQUEST)
+    calls = tokenizer.calls
+    compiled.encode(**{**REQUEST, 'question': "Another question?"})
+    assert tokenizer.calls - calls == 2  # name and question; the segment is cached
+
+
+def test_invalid_templates():
+    with pytest.raises(ValueError):
+        CompiledTemplate(static="Hello {{name}}")
+    with pytest.raises(ValueError):
+        CompiledTemplate(dynamic="{{question}}", cache_key=("location",))
+    with pytest.raises(RuntimeError):
+        CompiledTemplate(dynamic="{{question}}").encode(question="why?")
+
+
+def test_hr_assistant_template_fields():
+    assert set(hr_assistant_template().fields) == {
+        "location", "leave_policy_by_location", "optional_hr_annotations",
+        "employee_name", "department", "user_input"}
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+import telemetry
+
+
+@pytest.fixture
+def enabled():
+    telemetry.reset()
+    telemetry.enable()
+    yield
+    telemetry.enable()  # clear any exporter paths a test configured
+    telemetry.disable()
+    telemetry.reset()
+
+
+def test_disabled_calls_record_nothing():
+    telemetry.reset()
+    telemetry.count("rag_queries_total")
+    telemetry.observe("rag_ttft_seconds", 0.1)
+    with telemetry.span("query") as span:
+        span.set(n=1)
+    assert telemetry.prometheus_text() == "\n"
+    assert telemetry.otlp_records() == []
+
+
+def test_prometheus_text(enabled):
+    telemetry.count("rag_queries_total")
+    telemetry.count("rag_queries_total", 2)
+    telemetry.count("rag_cache_total", result="hit")
+    telemetry.count("rag_cache_total", result='say "hi"\n')
+    for value in (0.004, 0.02, 100.0):
+        telemetry.observe("rag_ttft_seconds", value)
+    telemetry.observe("rag_batch_size", 3)
+
+    lines = telemetry.prometheus_text().splitlines()
+    assert lines.count("# TYPE rag_queries_total counter") == 1
+    assert "rag_queries_total 3" in lines
+    assert 'rag_cache_total{result="hit"} 1' in lines
+    assert 'rag_cache_total{result="say \\"hi\\"\\n"} 1' in lines
+    assert "# TYPE rag_ttft_seconds histogram" in lines
+    assert 'rag_ttft_seconds_bucket{le="0.005"} 1' in lines
+    assert 'rag_ttft_seconds_bucket{le="0.025"} 2' in lines
+    assert 'rag_ttft_seconds_bucket{le="60"} 2' in lines
+    assert 'rag_ttft_seconds_bucket{le="+Inf"} 3' in lines
+    assert "rag_ttft_seconds_count 3" in lines
+    assert 'rag_batch_size_bucket{le="4"} 1' in lines  # size buckets for non-latency names
+
+
+def test_spans_nest_and_export_as_otlp(enabled):
+    with telemetry.span("query", question="q") as outer:
+        with telemetry.span("retrieve", k=5, exact=True):
+            pass
+    with pytest.raises(ValueError):
+        with telemetry.span("generate"):
+            raise ValueError("boom")
+    telemetry.count("rag_queries_total")
+
+    traces, metrics = telemetry.otlp_records()
+    spans = {s['name']: s for s in traces['resourceSpans'][0]['scopeSpans'][0]['spans']}
+    assert spans['retrieve']['traceId'] == spans['query']['traceId'] == outer.trace_id
+    assert spans['retrieve']['parentSpanId'] == spans['query']['spanId']
+    assert 'parentSpanId' not in spans['query'] and spans['generate']['traceId'] != outer.trace_id
+    assert {'key': 'k', 'value': {'intValue': "5"}} in spans['retrieve']['attributes']
+    assert {'key': 'exact', 'value': {'boolValue': True}} in spans['retrieve']['attributes']
+    assert spans['generate']['status'] == {'code': 2} and spans['query']['status'] == {'code': 1}
+    assert int(spans['query']['endTimeUnixNano']) >= int(spans['retrieve']['endTimeUnixNano'])
+
+    by_name = {m['name']: m for m in metrics['resourceMetrics'][0]['scopeMetrics'][0]['metrics']}
+    assert by_name['rag_queries_total']['sum']['dataPoints'][0]['asDouble'] == 1
+    assert by_name['rag_span_seconds']['histogram']['dataPoints'][0]['explicitBounds'] == \
+        list(telemetry.LATENCY_BUCKETS)
+    assert len(telemetry.otlp_records()) == 1  # spans were drained, metrics remain
+
+
+def test_flush_writes_both_exporters(enabled, tmp_path):
+    prometheus_path, otlp_path = tmp_path / "metrics.prom", tmp_path / "traces.jsonl"
+    telemetry.enable(prometheus_path=str(prometheus_path), otlp_path=str(otlp_path))
+    with telemetry.span("ingest"):
+        telemetry.count("rag_pages_total", 4)
+    telemetry.flush()
+    telemetry.flush()
+
+    assert "rag_pages_total 4" in prometheus_path.read_text().splitlines()
+    records = [json.loads(line) for line in otlp_path.read_text().splitlines()]
+    assert sum('resourceSpans' in record for record in records) == 1
+    assert sum('resourceMetrics' in record for record in records) == 2